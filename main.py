@@ -1,9 +1,15 @@
 from fastapi import FastAPI
-from fastapi.responses import ORJSONResponse, FileResponse
+from fastapi.responses import ORJSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
+import asyncio
+import os
+import orjson
 
 from src.services.fast_pathfinding_service import FastRoutingService
 from src.services.overpass_service import fetch_from_overpass
@@ -11,9 +17,31 @@ from src.services.graph_builder import build_graph_from_osm
 
 from src.app.api.fast_routing import router as routing_router
 
+# Brotli (optional, fallback về gzip nếu không có)
+try:
+    from brotli_asgi import BrotliMiddleware
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
 # Global routing service
 fast_routing_service: FastRoutingService = None
 
+# /health bytes - build lại khi routing service được khởi tạo
+_health_payload: bytes = orjson.dumps({"status": "unhealthy", "message": "Routing service chưa sẵn sàng"})
+
+# ENV=prod: nhiều worker, không reload (xem __main__)
+IS_PROD = os.getenv("ENV", "dev") == "prod"
+
+# Frontend HTML - prod đọc 1 lần lúc startup thay vì open()/stat() mỗi request;
+# dev đọc file mỗi request (reload=True chỉ theo dõi .py, sửa index.html phải thấy ngay)
+INDEX_FILE = Path("templates") / "index.html"
+_index_bytes: Optional[bytes] = None
+
+# Cache-Control cho HTML (ngắn) và static assets CSS/JS/Lottie (dài)
+INDEX_CACHE_CONTROL = "public, max-age=300"
+STATIC_CACHE_CONTROL = "public, max-age=86400"
+
 # Phường Vĩnh Tuy, Hai Bà Trưng, Hà Nội (cố định)
 VINH_TUY_BBOX = (20.9850, 105.8550, 21.0150, 105.8950)
 
@@ -41,16 +69,24 @@ def init_routing_service():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Load data at startup"""
-    global fast_routing_service
+    global fast_routing_service, _health_payload, _index_bytes
 
     print("=" * 60)
     print("SMART ROUTING API - Phường Vĩnh Tuy")
     print("=" * 60)
     
+    # Executor riêng cho routing/FTS5 (asyncio.to_thread dùng default executor),
+    # tách khỏi threadpool mặc định của Starlette
+    executor = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="routing")
+    asyncio.get_running_loop().set_default_executor(executor)
+    
+    _index_bytes = INDEX_FILE.read_bytes() if IS_PROD and INDEX_FILE.exists() else None
+    
     fast_routing_service = init_routing_service()
     
     from src.app.api.fast_routing import set_routing_service
     set_routing_service(fast_routing_service)
+    _health_payload = orjson.dumps(_build_health(fast_routing_service))
     
     app.include_router(routing_router, prefix="/api/v1/routing", tags=["routing"])
 
@@ -74,6 +110,7 @@ async def lifespan(app: FastAPI):
 
     yield
     print("Shutting down...")
+    executor.shutdown(wait=False)
 
 
 app = FastAPI(
@@ -93,28 +130,44 @@ app.add_middleware(
     allow_headers=["*"],  # Cho phép tất cả headers
 )
 
+# Nén response (geometry /route rất lặp → nén tốt). Add sau CORS để bọc ngoài cùng.
+# Response < 1KB (health, suggest ngắn) không đáng nén.
+if HAS_BROTLI:
+    app.add_middleware(BrotliMiddleware, quality=4, minimum_size=1024, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=1)
 
-@app.get("/health", tags=["health"])
-def health_check():
-    """Kiểm tra trạng thái API"""
-    if fast_routing_service and fast_routing_service.graph:
+
+def _build_health(service: FastRoutingService) -> dict:
+    """Payload cho /health - chỉ thay đổi khi load graph mới"""
+    if service and service.graph:
         return {
             "status": "healthy",
             "area": "Phường Vĩnh Tuy",
-            "nodes": fast_routing_service.graph.node_count,
-            "edges": fast_routing_service.graph.edge_count,
-            "bounds": fast_routing_service.graph.get_bounds()
+            "nodes": service.graph.node_count,
+            "edges": service.graph.edge_count,
+            "bounds": service.graph.get_bounds()
         }
     return {"status": "unhealthy", "message": "Routing service chưa sẵn sàng"}
 
 
+@app.get("/health", tags=["health"])
+def health_check():
+    """Kiểm tra trạng thái API"""
+    return Response(content=_health_payload, media_type="application/json")
+
+
 @app.get("/", tags=["info"])
 def root():
     """Serve frontend HTML"""
-    templates_dir = Path("templates")
-    index_file = templates_dir / "index.html"
-    if index_file.exists():
-        return FileResponse(index_file)
+    if _index_bytes is not None:
+        return Response(
+            content=_index_bytes,
+            media_type="text/html",
+            headers={"Cache-Control": INDEX_CACHE_CONTROL}
+        )
+    if INDEX_FILE.exists():
+        return FileResponse(INDEX_FILE)
     return {
         "name": "Smart Routing API",
         "area": "Phường Vĩnh Tuy, Hà Nội",
@@ -123,17 +176,42 @@ def root():
         "frontend": "/templates/index.html"
     }
 
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles kèm Cache-Control để browser không tải lại asset mỗi lần"""
+    
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault("Cache-Control", STATIC_CACHE_CONTROL)
+        return response
+
+
 # Mount static files (CSS, JS)
 static_dir = Path("static")
 if static_dir.exists():
-    app.mount("/static", StaticFiles(directory="static"), name="static")
+    app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 
 # Mount Components folder for Lottie animations
 components_dir = Path("Components")
 if components_dir.exists():
-    app.mount("/Components", StaticFiles(directory="Components"), name="components")
+    app.mount("/Components", CachedStaticFiles(directory="Components"), name="components")
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    
+    if IS_PROD:
+        # Production: nhiều worker (mỗi worker tự load graph trong lifespan),
+        # uvloop + httptools, không reload, không access log
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=max(2, os.cpu_count() or 1),
+            loop="uvloop",
+            http="httptools",
+            log_level="warning",
+            access_log=False
+        )
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -5,13 +5,20 @@ Unified Routing API
 - Tự động resolve input type và route
 """
 from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import ORJSONResponse
-from typing import Optional, List, Dict, Any, Literal, Union
-from pydantic import BaseModel, Field, field_validator
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from typing import Optional, List, Dict, Any, Literal, Union, Tuple, NamedTuple, Annotated, Iterator
+from pydantic import BaseModel, Field, StringConstraints
+from functools import lru_cache
+from types import MappingProxyType
+import asyncio
 import time
+import unicodedata
+import numpy as np
+import orjson
 
 from src.services.fast_pathfinding_service import FastRoutingService
-from src.services.graph_builder import C_HIGHWAY, C_CONTEXT
+from src.services.graph_builder import C_HIGHWAY, C_CONTEXT, iter_graph_features
+from src.services.geojson_stream import iter_feature_collection
 
 router = APIRouter(default_response_class=ORJSONResponse)
 
@@ -20,21 +27,73 @@ _routing_service: Optional[FastRoutingService] = None
 # Threshold cho exact match (score >= này thì dùng node_id trực tiếp)
 EXACT_MATCH_THRESHOLD = 80
 
+# Số input (node_id / coords / address) đã resolve được giữ lại trong LRU
+RESOLVE_CACHE_SIZE = 4096
+
+# Số (query, limit) FTS5 đã tìm được giữ lại trong LRU (autocomplete lặp prefix liên tục)
+SEARCH_CACHE_SIZE = 2048
+
+SAME_NODE_DETAIL = "Origin và destination trùng nhau"
+SERVICE_UNAVAILABLE_DETAIL = "Service chưa sẵn sàng"
+
+# Số tọa độ mỗi chunk khi stream geometry của /route?stream=true
+ROUTE_STREAM_CHUNK = 512
+
+# Chỗ giữ route.geometry.coordinates khi stream /route (_route_to_chunks)
+_STREAM_PLACEHOLDER = "__route_stream_coordinates__"
+
+# Option orjson giống ORJSONResponse.render (khi encode sẵn bytes ngoài response class)
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+# Timer int (ns) - tránh float + round() trên hot path
+_ns = time.perf_counter_ns
+
+
+def _ms(ns: int) -> float:
+    """ns → ms, 2 chữ số thập phân bằng phép chia nguyên"""
+    return ns // 10_000 / 100
+
+
+# Singleton rỗng (read-only) cho request không có blocking/flood geometries
+_EMPTY_BLOCKED: frozenset = frozenset()
+_EMPTY_MULT = MappingProxyType({})
+
+# /info bytes - build lại mỗi lần set_routing_service
+_info_payload: bytes = orjson.dumps({"status": "not_ready"})
+
 
 def set_routing_service(service: FastRoutingService):
-    global _routing_service
-    _routing_service = service
+    global _routing_service, _info_payload
+    # Chỉ giữ service đã load xong graph → handler chỉ cần check `is None`
+    _routing_service = service if service is not None and service.graph is not None else None
+    _info_payload = orjson.dumps(_build_info(service))
+    # Graph mới → node_id cũ có thể không còn hợp lệ
+    _resolve_node_cached.cache_clear()
+    _resolve_coords_pair_cached.cache_clear()
+    _search_cached.cache_clear()
 
 
-def _check_service():
-    if _routing_service is None or _routing_service.graph is None:
-        raise HTTPException(status_code=503, detail="Service chưa sẵn sàng")
+def _check_service() -> FastRoutingService:
+    svc = _routing_service
+    if svc is None:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE_DETAIL)
+    return svc
 
 
 # ======================================================================
 # Pydantic Models
 # ======================================================================
 
+# Kiểu input cho origin/destination - validate hoàn toàn trong pydantic-core
+# (không có Python validator chạy mỗi request)
+Coords = Tuple[
+    Annotated[float, Field(ge=-90, le=90)],     # lat
+    Annotated[float, Field(ge=-180, le=180)],   # lon
+]
+Address = Annotated[str, StringConstraints(strip_whitespace=True, min_length=2)]
+PointInput = Union[int, Coords, Address]
+
+
 class RouteRequest(BaseModel):
     """
     Unified Route Request
@@ -50,11 +109,11 @@ class RouteRequest(BaseModel):
         {"origin": "Phố Vĩnh Tuy", "destination": "Ngõ 121 Lê Thanh Nghị"}
         {"origin": "Phố Vĩnh Tuy", "destination": [21.010, 105.880]}
     """
-    origin: Union[int, List[float], str] = Field(
+    origin: PointInput = Field(
         ..., 
         description="Điểm bắt đầu: node_id (int), [lat, lon], hoặc địa chỉ (str)"
     )
-    destination: Union[int, List[float], str] = Field(
+    destination: PointInput = Field(
         ..., 
         description="Điểm kết thúc: node_id (int), [lat, lon], hoặc địa chỉ (str)"
     )
@@ -70,32 +129,10 @@ class RouteRequest(BaseModel):
         default=[],
         description="Vùng ngập (tăng trọng số)"
     )
-    
-    @field_validator('origin', 'destination')
-    @classmethod
-    def validate_point(cls, v):
-        if isinstance(v, int):
-            return v
-        if isinstance(v, str):
-            if len(v.strip()) < 2:
-                raise ValueError("Địa chỉ phải có ít nhất 2 ký tự")
-            return v.strip()
-        if isinstance(v, list):
-            if len(v) != 2:
-                raise ValueError("Tọa độ phải có đúng 2 phần tử [lat, lon]")
-            if not all(isinstance(x, (int, float)) for x in v):
-                raise ValueError("Tọa độ phải là số")
-            lat, lon = v
-            if not (-90 <= lat <= 90):
-                raise ValueError(f"Latitude phải trong khoảng [-90, 90], got {lat}")
-            if not (-180 <= lon <= 180):
-                raise ValueError(f"Longitude phải trong khoảng [-180, 180], got {lon}")
-            return v
-        raise ValueError("Phải là node_id (int), [lat, lon], hoặc địa chỉ (str)")
-
-
-class ResolvedNode(BaseModel):
-    """Kết quả resolve một điểm"""
+
+
+class ResolvedNode(NamedTuple):
+    """Kết quả resolve một điểm (nội bộ, không qua validate → NamedTuple)"""
     node_id: int
     lat: float
     lon: float
@@ -109,9 +146,101 @@ class ResolvedNode(BaseModel):
 # Core Logic: Resolve Node
 # ======================================================================
 
-def _resolve_node(point: Union[int, List[float], str]) -> ResolvedNode:
+def _normalize_query(query: str) -> str:
+    """
+    Chuẩn hóa query địa chỉ làm cache key: NFC + casefold + gộp khoảng trắng
+    
+    Giữ nguyên dấu (FTS5/LIKE so trên cột đã bỏ dấu, còn RapidFuzz thì không)
+    để kết quả cache không phụ thuộc vào query nào đến trước.
+    """
+    return " ".join(unicodedata.normalize("NFC", query).casefold().split())
+
+
+@lru_cache(maxsize=SEARCH_CACHE_SIZE)
+def _search_cached(norm_query: str, limit: int) -> Tuple[Dict[str, Any], ...]:
+    """FTS5 search qua LRU cache - kết quả không đổi giữa các lần load graph"""
+    return tuple(_routing_service.search_address(norm_query, limit))
+
+
+def _resolve_key(point: PointInput) -> tuple:
+    """
+    Chuẩn hóa input thành cache key (hashable)
+    
+    - int → ("int", node_id)
+    - str → ("str", address đã chuẩn hóa bởi _normalize_query)
+    - [lat, lon] → ("coord", lat, lon) làm tròn 6 chữ số (~0.1m)
+    """
+    if isinstance(point, int):
+        return ("int", point)
+    if isinstance(point, str):
+        return ("str", _normalize_query(point))
+    lat, lon = point
+    return ("coord", round(lat, 6), round(lon, 6))
+
+
+def _resolve_node(point: PointInput) -> ResolvedNode:
+    """Resolve input thành Node ID - qua LRU cache theo input đã chuẩn hóa"""
+    return _resolve_node_cached(_resolve_key(point))
+
+
+def _resolve_endpoints(
+    origin: PointInput,
+    destination: PointInput
+) -> Tuple[ResolvedNode, ResolvedNode]:
+    """
+    Resolve origin và destination
+    
+    Nếu cả 2 đều là [lat, lon] (click map) → snap chung một batch query KD-Tree
+    """
+    origin_key = _resolve_key(origin)
+    dest_key = _resolve_key(destination)
+    
+    # Input giống hệt nhau → chắc chắn cùng node, không cần resolve
+    if origin_key == dest_key:
+        raise HTTPException(status_code=400, detail=SAME_NODE_DETAIL)
+    
+    if origin_key[0] == "coord" and dest_key[0] == "coord":
+        return _resolve_coords_pair_cached(origin_key, dest_key)
+    
+    origin_resolved = _resolve_node_cached(origin_key)
+    # Destination là node_id trùng với origin đã resolve → bỏ qua resolve thứ 2
+    if dest_key[0] == "int" and dest_key[1] == origin_resolved.node_id:
+        raise HTTPException(status_code=400, detail=SAME_NODE_DETAIL)
+    
+    return origin_resolved, _resolve_node_cached(dest_key)
+
+
+def _snapped_coords_node(node_id: int) -> ResolvedNode:
+    """ResolvedNode cho input [lat, lon] đã snap về node_id"""
+    node = _routing_service.graph.get_node(node_id)
+    return ResolvedNode(
+        node_id=node_id,
+        lat=node.lat,
+        lon=node.lon,
+        input_type="coords",
+        snapped=True
+    )
+
+
+@lru_cache(maxsize=RESOLVE_CACHE_SIZE)
+def _resolve_coords_pair_cached(origin_key: tuple, dest_key: tuple) -> Tuple[ResolvedNode, ResolvedNode]:
+    """Resolve cặp [lat, lon] bằng một lần query KD-Tree (k=2 điểm)"""
+    coords = np.asarray([origin_key[1:], dest_key[1:]])
+    node_ids = _routing_service.find_nearest_nodes_batch(coords)
+    
+    if node_ids is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Không tìm thấy node gần tọa độ [{origin_key[1]}, {origin_key[2]}]"
+        )
+    
+    return _snapped_coords_node(int(node_ids[0])), _snapped_coords_node(int(node_ids[1]))
+
+
+@lru_cache(maxsize=RESOLVE_CACHE_SIZE)
+def _resolve_node_cached(key: tuple) -> ResolvedNode:
     """
-    Resolve input thành Node ID
+    Resolve input (đã chuẩn hóa bởi _resolve_key) thành Node ID
     
     - Nếu int: Kiểm tra node tồn tại trong graph
     - Nếu [lat, lon]: Smart snap bằng KD-Tree đến LSCC
@@ -123,10 +252,13 @@ def _resolve_node(point: Union[int, List[float], str]) -> ResolvedNode:
         ResolvedNode với thông tin đầy đủ
     
     Raises:
-        HTTPException nếu không resolve được
+        HTTPException nếu không resolve được (lỗi không được cache)
     """
+    kind = key[0]
+    
     # Case 1: Input là node_id (int)
-    if isinstance(point, int):
+    if kind == "int":
+        point = key[1]
         if not _routing_service.graph.has_node(point):
             raise HTTPException(
                 status_code=400,
@@ -142,9 +274,10 @@ def _resolve_node(point: Union[int, List[float], str]) -> ResolvedNode:
         )
     
     # Case 2: Input là address (str) - Manual Entry
-    if isinstance(point, str):
+    if kind == "str":
+        point = key[1]
         # Bước 1: Tìm kiếm trong FTS5 database
-        results = _routing_service.search_address(point, limit=1)
+        results = _search_cached(point, 1)
         
         if not results:
             raise HTTPException(
@@ -194,7 +327,7 @@ def _resolve_node(point: Union[int, List[float], str]) -> ResolvedNode:
     
     # Case 3: Input là [lat, lon] - Click Map
     else:
-        lat, lon = point
+        _, lat, lon = key
         node_id = _routing_service.find_nearest_node(lat, lon)
         
         if node_id is None:
@@ -203,18 +336,30 @@ def _resolve_node(point: Union[int, List[float], str]) -> ResolvedNode:
                 detail=f"Không tìm thấy node gần tọa độ [{lat}, {lon}]"
             )
         
-        node = _routing_service.graph.get_node(node_id)
-        return ResolvedNode(
-            node_id=node_id,
-            lat=node.lat,
-            lon=node.lon,
-            input_type="coords",
-            snapped=True
-        )
+        return _snapped_coords_node(node_id)
 
 
-def _process_geometries(blocking, flood):
+def _resolved_info(resolved: ResolvedNode) -> Dict[str, Any]:
+    """Dict cho response từ ResolvedNode"""
+    info = {
+        "node_id": resolved.node_id,
+        "lat": resolved.lat,
+        "lon": resolved.lon,
+        "input_type": resolved.input_type,
+        "snapped": resolved.snapped
+    }
+    if resolved.matched_address:
+        info["matched_address"] = resolved.matched_address
+        info["match_score"] = resolved.match_score
+    return info
+
+
+def _process_geometries(svc: FastRoutingService, blocking, flood):
     """Xử lý blocking/flood geometries và blocked road segments (theo path)"""
+    # Trường hợp phổ biến nhất: không có vùng cấm / vùng ngập
+    if not blocking and not flood:
+        return _EMPTY_BLOCKED, _EMPTY_MULT, _EMPTY_BLOCKED
+    
     all_ban = blocking or []
     
     for geom in (flood or []):
@@ -232,7 +377,7 @@ def _process_geometries(blocking, flood):
         
         if path and isinstance(path, list) and len(path) >= 2:
             # Block tất cả edges trong path
-            edges_from_path = _routing_service.get_edges_from_path(path)
+            edges_from_path = svc.get_edges_from_path(path)
             blocked_edges_from_paths.update(edges_from_path)
         else:
             # Geometry blocking (như cũ)
@@ -241,8 +386,8 @@ def _process_geometries(blocking, flood):
     all_geoms = blocking_geoms + (flood or [])
     
     # Xử lý geometries (bao gồm block intersections - ngã 3, ngã 4)
-    if all_geoms and _routing_service:
-        blocked_from_geom, penalty_map, blocked_nodes = _routing_service.apply_blocking_geometries(all_geoms)
+    if all_geoms:
+        blocked_from_geom, penalty_map, blocked_nodes = svc.apply_blocking_geometries(all_geoms)
     else:
         blocked_from_geom, penalty_map, blocked_nodes = set(), {}, set()
     
@@ -257,7 +402,10 @@ def _process_geometries(blocking, flood):
 # ======================================================================
 
 @router.post("/route", response_class=ORJSONResponse)
-def unified_route(request: RouteRequest):
+async def unified_route(
+    request: RouteRequest,
+    stream: bool = Query(default=False, description="Stream geometry theo từng chunk (route dài)")
+):
     """
     🚀 UNIFIED ROUTING ENDPOINT
     
@@ -304,34 +452,84 @@ def unified_route(request: RouteRequest):
     {"origin": "Phố Vĩnh Tuy", "destination": "Phố Thanh Nhàn", "weather": "rain"}
     ```
     """
-    _check_service()
+    svc = _routing_service
+    if svc is None:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE_DETAIL)
+    
+    if stream:
+        # Resolve + spatial query + A* chạy trong executor, không block event loop
+        result = await asyncio.to_thread(_do_route_sync, svc, request)
+        if "route" in result:
+            return StreamingResponse(_route_to_chunks(result), media_type="application/json")
+        return ORJSONResponse(content=result)
+    # Encode JSON ngay trong executor cùng A* → geometry lớn không encode trên event loop,
+    # trả bytes trực tiếp (bỏ qua jsonable_encoder, orjson encode một lần)
+    body = await asyncio.to_thread(_route_bytes_sync, svc, request)
+    return Response(content=body, media_type="application/json")
+
+
+def _route_bytes_sync(svc: FastRoutingService, request: RouteRequest) -> bytes:
+    """_do_route_sync + encode JSON (cùng option với ORJSONResponse) - chạy trong thread"""
+    return orjson.dumps(_do_route_sync(svc, request), option=_ORJSON_OPTIONS)
+
+
+def _route_to_chunks(result: Dict[str, Any], chunk_size: int = ROUTE_STREAM_CHUNK) -> Iterator[bytes]:
+    """
+    Serialize kết quả /route thành các chunk JSON
     
-    start_time = time.perf_counter()
+    Encode cả result (cùng option với non-stream) với placeholder thay cho
+    route.geometry.coordinates, rồi chèn tọa độ (phần lớn nhất) theo từng khúc chunk_size
+    vào đúng chỗ placeholder → mọi key khác giữ nguyên thứ tự/giá trị như response thường
+    """
+    route = result["route"]
+    geometry = route["geometry"]
+    coords = geometry["coordinates"]
+    shell = orjson.dumps(
+        {**result, "route": {**route, "geometry": {**geometry, "coordinates": _STREAM_PLACEHOLDER}}},
+        option=_ORJSON_OPTIONS
+    )
+    marker = orjson.dumps(_STREAM_PLACEHOLDER)
+    if shell.count(marker) != 1:
+        # Placeholder trùng dữ liệu thật (gần như không xảy ra) → trả 1 chunk
+        yield orjson.dumps(result, option=_ORJSON_OPTIONS)
+        return
+    head, tail = shell.split(marker)
+    
+    yield head + b"["
+    for i in range(0, len(coords), chunk_size):
+        chunk = orjson.dumps(coords[i:i + chunk_size], option=_ORJSON_OPTIONS)[1:-1]
+        yield chunk if i == 0 else b"," + chunk
+    yield b"]" + tail
+
+
+def _do_route_sync(svc: FastRoutingService, request: RouteRequest) -> Dict[str, Any]:
+    """Phần đồng bộ của /route: resolve → spatial query → A* (chạy trong thread)"""
+    start_ns = _ns()
     
     try:
         # Step 1: Resolve origin và destination
-        origin_resolved = _resolve_node(request.origin)
-        dest_resolved = _resolve_node(request.destination)
+        origin_resolved, dest_resolved = _resolve_endpoints(request.origin, request.destination)
         
-        resolve_time = time.perf_counter() - start_time
+        resolve_ns = _ns() - start_ns
         
-        # Check same node
+        # Check same node (input khác nhau nhưng snap về cùng node)
         if origin_resolved.node_id == dest_resolved.node_id:
             raise HTTPException(
                 status_code=400,
-                detail="Origin và destination trùng nhau"
+                detail=SAME_NODE_DETAIL
             )
         
         # Step 2: Process blocking geometries (STRtree spatial query)
-        spatial_start = time.perf_counter()
+        spatial_start = _ns()
         blocked, penalty_map, blocked_nodes = _process_geometries(
+            svc,
             request.blocking_geometries,
             request.flood_areas
         )
-        spatial_time = time.perf_counter() - spatial_start
+        spatial_ns = _ns() - spatial_start
         
         # Step 3: Execute routing (use node IDs directly)
-        result = _routing_service.find_route_by_node_ids(
+        result = svc.find_route_by_node_ids(
             origin_resolved.node_id,
             dest_resolved.node_id,
             request.weather,
@@ -340,42 +538,20 @@ def unified_route(request: RouteRequest):
             blocked_nodes
         )
         
-        total_time = time.perf_counter() - start_time
+        total_ns = _ns() - start_ns
         
         # Step 4: Enrich response
         if "error" not in result:
             # Add spatial query stats
-            result["stats"]["spatial_query_ms"] = round(spatial_time * 1000, 2)
+            result["stats"]["spatial_query_ms"] = _ms(spatial_ns)
             result["stats"]["affected_edges"] = len(blocked) + len(penalty_map)
             # Build resolved info
-            origin_info = {
-                "node_id": origin_resolved.node_id,
-                "lat": origin_resolved.lat,
-                "lon": origin_resolved.lon,
-                "input_type": origin_resolved.input_type,
-                "snapped": origin_resolved.snapped
-            }
-            if origin_resolved.matched_address:
-                origin_info["matched_address"] = origin_resolved.matched_address
-                origin_info["match_score"] = origin_resolved.match_score
-            
-            dest_info = {
-                "node_id": dest_resolved.node_id,
-                "lat": dest_resolved.lat,
-                "lon": dest_resolved.lon,
-                "input_type": dest_resolved.input_type,
-                "snapped": dest_resolved.snapped
-            }
-            if dest_resolved.matched_address:
-                dest_info["matched_address"] = dest_resolved.matched_address
-                dest_info["match_score"] = dest_resolved.match_score
-            
             result["resolved"] = {
-                "origin": origin_info,
-                "destination": dest_info
+                "origin": _resolved_info(origin_resolved),
+                "destination": _resolved_info(dest_resolved)
             }
-            result["stats"]["resolve_time_ms"] = round(resolve_time * 1000, 2)
-            result["stats"]["total_time_ms"] = round(total_time * 1000, 2)
+            result["stats"]["resolve_time_ms"] = _ms(resolve_ns)
+            result["stats"]["total_time_ms"] = _ms(total_ns)
         
         return result
         
@@ -390,7 +566,7 @@ def unified_route(request: RouteRequest):
 # ======================================================================
 
 @router.get("/suggest", response_class=ORJSONResponse)
-def suggest_address(
+async def suggest_address(
     q: str = Query(..., min_length=2, description="Chuỗi tìm kiếm (min 2 ký tự)"),
     limit: int = Query(default=5, ge=1, le=20, description="Số kết quả tối đa")
 ):
@@ -413,45 +589,49 @@ def suggest_address(
     }
     ```
     """
-    _check_service()
-    
-    start = time.perf_counter()
-    results = _routing_service.search_address(q, limit)
-    elapsed_ms = (time.perf_counter() - start) * 1000
+    if _routing_service is None:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE_DETAIL)
+    
+    start = _ns()
+    norm_query = _normalize_query(q)
+    # "a  " qua được min_length nhưng sau chuẩn hóa < 2 ký tự → không cần hop sang thread/FTS5
+    if len(norm_query) < 2:
+        results = ()
+    else:
+        results = await asyncio.to_thread(_search_cached, norm_query, limit)
+    elapsed_ns = _ns() - start
     
-    return {
+    return ORJSONResponse({
         "query": q,
         "results": results,
         "count": len(results),
-        "time_ms": round(elapsed_ms, 2)
-    }
+        "time_ms": _ms(elapsed_ns)
+    })
 
 
 @router.get("/geocoding/stats", response_class=ORJSONResponse)
 def get_geocoding_stats():
     """Thống kê local geocoding database"""
-    _check_service()
-    return _routing_service.get_geocoding_stats()
+    return _check_service().get_geocoding_stats()
 
 
 # ======================================================================
 # Info Endpoints
 # ======================================================================
 
-@router.get("/info", response_class=ORJSONResponse)
-def get_info():
-    """Thông tin service"""
-    if _routing_service is None or _routing_service.graph is None:
+def _build_info(service: Optional[FastRoutingService]) -> Dict[str, Any]:
+    """Payload cho /info - chỉ thay đổi khi load graph mới"""
+    if service is None or service.graph is None:
         return {"status": "not_ready"}
     
-    bounds = _routing_service.graph.get_bounds()
-    geocoding = _routing_service.get_geocoding_stats()
+    bounds = service.graph.get_bounds()
+    geocoding = service.get_geocoding_stats()
     
     return {
         "status": "ready",
         "graph": {
-            "nodes": _routing_service.graph.node_count,
-            "edges": _routing_service.graph.edge_count,
+            "nodes": service.graph.node_count,
+            "edges": service.graph.edge_count,
             "bounds": {
                 "min_lat": bounds[0], 
                 "min_lon": bounds[1], 
@@ -473,9 +653,14 @@ def get_info():
     }
 
 
-@router.get("/coefficients", response_class=ORJSONResponse)
-def get_coefficients(weather: Literal["normal", "rain", "flood"] = Query(default="normal")):
-    """Bảng hệ số trọng số theo thời tiết"""
+@router.get("/info", response_class=ORJSONResponse)
+def get_info():
+    """Thông tin service (payload serialize sẵn tại set_routing_service)"""
+    return Response(content=_info_payload, media_type="application/json")
+
+
+def _build_coefficients(weather: str) -> Dict[str, Any]:
+    """Bảng hệ số cho một điều kiện thời tiết (sắp xếp theo total)"""
     ctx = C_CONTEXT.get(weather, C_CONTEXT["normal"])
     return {
         "weather": weather,
@@ -491,6 +676,31 @@ def get_coefficients(weather: Literal["normal", "rain", "flood"] = Query(default
     }
 
 
+# C_HIGHWAY/C_CONTEXT là hằng số → serialize sẵn 1 lần cho mỗi weather
+_COEFF_CACHE: Dict[str, bytes] = {
+    w: orjson.dumps(_build_coefficients(w)) for w in ("normal", "rain", "flood")
+}
+
+
+@router.get("/coefficients", response_class=ORJSONResponse)
+def get_coefficients(weather: Literal["normal", "rain", "flood"] = Query(default="normal")):
+    """Bảng hệ số trọng số theo thời tiết"""
+    return Response(content=_COEFF_CACHE[weather], media_type="application/json")
+
+
+@router.get("/geojson")
+def get_graph_geojson():
+    """
+    Mạng đường (đã nén) dạng GeoJSON FeatureCollection - stream từng chunk,
+    không dựng list feature của cả graph trong bộ nhớ
+    """
+    svc = _check_service()
+    return StreamingResponse(
+        iter_feature_collection(iter_graph_features(svc.graph)),
+        media_type="application/geo+json"
+    )
+
+
 @router.get("/nearest-node", response_class=ORJSONResponse)
 def find_nearest_node(lat: float, lon: float):
     """
@@ -498,12 +708,12 @@ def find_nearest_node(lat: float, lon: float):
     
     Hữu ích để debug hoặc preview snap position
     """
-    _check_service()
+    svc = _check_service()
     
-    node_id = _routing_service.find_nearest_node(lat, lon)
+    node_id = svc.find_nearest_node(lat, lon)
     if node_id is None:
         return {"error": "Không tìm thấy"}
     
-    node = _routing_service.graph.get_node(node_id)
+    node = svc.graph.get_node(node_id)
     return {"node_id": node_id, "lat": node.lat, "lon": node.lon}
 
@@ -5,11 +5,12 @@ Admin & User endpoints for flood zones
 - User: fetch active zones
 """
 from fastapi import APIRouter, HTTPException, Body, Path, Query
-from fastapi.responses import ORJSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
 
 from src.services import flood_zone_service as fzs
+from src.services.geojson_stream import iter_feature_collection
 
 
 router = APIRouter(default_response_class=ORJSONResponse)
@@ -50,6 +51,13 @@ def admin_create_flood_zone(payload: FloodZoneCreate):
     return {"id": zone_id, "message": "Created"}
 
 
+@router.post("/admin/flood-zones/bulk", response_class=ORJSONResponse)
+def admin_bulk_create_flood_zones(payload: List[FloodZoneCreate]):
+    """Import nhiều zone trong 1 transaction"""
+    count = fzs.create_zones([item.dict() for item in payload])
+    return {"count": count, "message": "Created"}
+
+
 @router.put("/admin/flood-zones/{zone_id}", response_class=ORJSONResponse)
 def admin_update_flood_zone(zone_id: int = Path(...), payload: FloodZoneUpdate = Body(...)):
     ok = fzs.update_zone(zone_id, {k: v for k, v in payload.dict().items() if v is not None})
@@ -70,8 +78,25 @@ def admin_delete_flood_zone(zone_id: int = Path(...)):
 # User endpoints
 # ============================
 @router.get("/user/flood-zones", response_class=ORJSONResponse)
-def user_active_flood_zones():
+def user_active_flood_zones(
+    bbox: Optional[str] = Query(default=None, description="min_lon,min_lat,max_lon,max_lat - chỉ lấy zone trong khung nhìn")
+):
     """Trả về các vùng ngập đang active để FE hiển thị cảnh báo"""
-    zones = fzs.get_active_zones()
+    if bbox:
+        try:
+            min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox.split(","))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="bbox phải là min_lon,min_lat,max_lon,max_lat")
+        zones = fzs.query_zones_for_bbox(min_lon, min_lat, max_lon, max_lat)
+    else:
+        zones = fzs.get_active_zones()
     return {"count": len(zones), "items": zones}
 
+
+@router.get("/user/flood-zones.geojson")
+def user_active_flood_zones_geojson():
+    """Vùng ngập active dạng GeoJSON FeatureCollection (blockType=flood), stream từng chunk"""
+    return StreamingResponse(
+        iter_feature_collection(fzs.iter_geojson_features(fzs.get_active_zones())),
+        media_type="application/geo+json"
+    )
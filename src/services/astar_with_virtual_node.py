@@ -9,7 +9,7 @@ from typing import Dict, List, Tuple, Optional, Set, Any
 from dataclasses import dataclass
 
 from .graph_builder import GraphNode, GraphEdge, LightGraph, haversine_distance
-from .fast_pathfinding_service import PathResult, _merge_geometries, _collect_edges_and_stats, heuristic
+from .fast_pathfinding_service import PathResult, _merge_geometries, _collect_edges_and_stats, _heuristic_array
 from .lite_geocoding_service import VirtualNode
 
 
@@ -74,8 +74,20 @@ def astar_with_virtual_nodes(
     else:
         return PathResult(success=False, error="Cần end_virtual hoặc end_node_id")
     
-    # Priority queue: (f_score, counter, node_id, is_virtual)
-    counter = 0
+    # Neighbor của virtual node → khoảng cách (m): membership/lookup O(1) thay vì quét list mỗi lần pop
+    # (reversed: trùng ID thì giữ entry đầu tiên như vòng for ... break)
+    start_neighbor_dist = {nid: d for nid, d in reversed(start_neighbors)} if start_virtual else {}
+    end_neighbor_dist = {nid: d for nid, d in reversed(end_neighbors)} if end_virtual else {}
+    end_neighbor_ids = frozenset(end_neighbor_dist)
+    
+    # Priority queue: (f_score, node_id) - hòa f thì so node_id, không cần counter
+    
+    # h(v) của mọi node đến end_ref_node, tính vectorized 1 lần từ lat_arr/lon_arr
+    # (chỉ equirectangular: end_ref_node chỉ là node tham chiếu của virtual end)
+    if graph.node_index is None:
+        graph.build_node_index()
+    node_index = graph.node_index
+    h_by_idx = _heuristic_array(graph, node_index[end_ref_node_id], weather, use_alt=False).tolist()
     
     # Khởi tạo từ virtual node hoặc node thật
     if start_virtual:
@@ -91,34 +103,38 @@ def astar_with_virtual_nodes(
             came_from[neighbor_id] = (None, start_virtual)  # None = từ virtual node
             came_from_edge[neighbor_id] = None
             
-            neighbor_node = graph.get_node(neighbor_id)
-            if neighbor_node:
-                f = g_score[neighbor_id] + heuristic(neighbor_node, end_ref_node)
-                counter += 1
-                heapq.heappush(open_set, (f, counter, neighbor_id))
+            neighbor_idx = node_index.get(neighbor_id)
+            if neighbor_idx is not None:
+                f = g_score[neighbor_id] + h_by_idx[neighbor_idx]
+                heapq.heappush(open_set, (f, neighbor_id))
     else:
-        open_set = [(0.0, counter, start_ref_node_id)]
+        open_set = [(0.0, start_ref_node_id)]
         g_score: Dict[int, float] = {start_ref_node_id: 0.0}
         came_from: Dict[int, Tuple[Optional[int], Optional[VirtualNode]]] = {start_ref_node_id: (None, None)}
         came_from_edge: Dict[int, Optional[GraphEdge]] = {}
     
-    open_set_hash: Set[int] = set(node_id for _, _, node_id in open_set)
     closed_set: Set[int] = set()
     nodes_visited = 0
     
+    # Bind local: hàm heap, row kề theo idx, weight theo edge_idx của weather (tính sẵn trên graph)
+    heappush, heappop = heapq.heappush, heapq.heappop
+    adjacency = graph.adjacency_by_idx
+    edges_by_idx = graph.edges_by_idx
+    weights = graph.weights_for(weather)
+    
     while open_set:
-        _, _, current = heapq.heappop(open_set)
+        _, current = heappop(open_set)
         
+        # Lazy decrease-key: node có thể nằm nhiều lần trong heap, entry đầu tiên pop ra là tốt nhất
         if current in closed_set:
             continue
         
-        open_set_hash.discard(current)
         nodes_visited += 1
         
         # Kiểm tra đích
         if end_virtual:
             # Đích là virtual node, kiểm tra nếu current là một trong neighbors
-            if any(neighbor_id == current for neighbor_id, _ in end_virtual.neighbors):
+            if current in end_neighbor_ids:
                 # Tìm đường đến virtual node
                 elapsed = time.perf_counter() - start_time
                 
@@ -129,12 +145,10 @@ def astar_with_virtual_nodes(
                 total_dur = 0.0
                 
                 # Thêm chi phí từ current đến virtual end node
-                for neighbor_id, dist in end_virtual.neighbors:
-                    if neighbor_id == current:
-                        total_dist += dist
-                        # Estimate travel time (assume 30 km/h)
-                        total_dur += (dist / 1000.0) / 30.0 * 3600
-                        break
+                dist = end_neighbor_dist[current]
+                total_dist += dist
+                # Estimate travel time (assume 30 km/h)
+                total_dur += (dist / 1000.0) / 30.0 * 3600
                 
                 # Reconstruct từ current về start
                 while current in came_from:
@@ -150,11 +164,10 @@ def astar_with_virtual_nodes(
                         # Đến virtual start node
                         if parent_virtual:
                             # Thêm chi phí từ virtual start đến current
-                            for neighbor_id, dist in parent_virtual.neighbors:
-                                if neighbor_id == current:
-                                    total_dist += dist
-                                    total_dur += (dist / 1000.0) / 30.0 * 3600
-                                    break
+                            dist = start_neighbor_dist.get(current)
+                            if dist is not None:
+                                total_dist += dist
+                                total_dur += (dist / 1000.0) / 30.0 * 3600
                         break
                     
                     path.append(parent_id)
@@ -195,12 +208,10 @@ def astar_with_virtual_nodes(
                 
                 # Thêm chi phí từ virtual start nếu có
                 if start_virtual and path:
-                    first_node = path[0]
-                    for neighbor_id, dist_virtual in start_virtual.neighbors:
-                        if neighbor_id == first_node:
-                            dist += dist_virtual
-                            dur += (dist_virtual / 1000.0) / 30.0 * 3600
-                            break
+                    dist_virtual = start_neighbor_dist.get(path[0])
+                    if dist_virtual is not None:
+                        dist += dist_virtual
+                        dur += (dist_virtual / 1000.0) / 30.0 * 3600
                 
                 coords = _merge_geometries(edges) if edges else []
                 
@@ -227,27 +238,22 @@ def astar_with_virtual_nodes(
         closed_set.add(current)
         current_g = g_score[current]
         
-        # Expand neighbors
-        for neighbor_id, edge in graph.get_neighbors(current):
+        # Expand neighbors: row theo dense idx (cùng thứ tự get_neighbors), weight đọc từ cột của weather
+        for neighbor_idx, neighbor_id, edge_idx in adjacency[node_index[current]]:
             if neighbor_id in closed_set:
                 continue
             
-            weight = edge.get_weight(weather)
-            tentative_g = current_g + weight
+            tentative_g = current_g + weights[edge_idx]
             
             if neighbor_id not in g_score or tentative_g < g_score[neighbor_id]:
                 came_from[neighbor_id] = (current, None)
-                came_from_edge[neighbor_id] = edge
+                came_from_edge[neighbor_id] = edges_by_idx[edge_idx]
                 g_score[neighbor_id] = tentative_g
                 
-                neighbor_node = graph.get_node(neighbor_id)
-                if neighbor_node:
-                    f = tentative_g + heuristic(neighbor_node, end_ref_node)
-                    
-                    if neighbor_id not in open_set_hash:
-                        counter += 1
-                        heapq.heappush(open_set, (f, counter, neighbor_id))
-                        open_set_hash.add(neighbor_id)
+                f = tentative_g + h_by_idx[neighbor_idx]
+                
+                # Luôn push khi g cải thiện (entry cũ thành stale, bị bỏ qua khi pop)
+                heappush(open_set, (f, neighbor_id))
     
     elapsed = time.perf_counter() - start_time
     return PathResult(
@@ -0,0 +1,263 @@
+# src/services/contraction_hierarchy.py
+"""
+Contraction Hierarchies (CH) cho graph tĩnh
+- Tiền xử lý 1 lần / weather lúc build graph (lưu cùng pickle cache)
+- Query: Dijkstra 2 chiều chỉ đi "lên" theo rank trên graph có shortcut
+- Shortcut được unpack về chuỗi edge_idx gốc → dựng geometry như A*
+
+Chỉ dùng cho query không có vùng ngập/chặn: policy theo query làm đổi weight,
+shortcut tính sẵn không còn đúng → các query đó vẫn chạy A*
+"""
+import heapq
+import math
+from typing import List, Tuple, Optional
+
+import numpy as np
+
+# Witness search dừng sau số node settle này (thiếu witness chỉ thêm shortcut thừa, vẫn đúng)
+WITNESS_SETTLE_LIMIT = 200
+
+
+class ContractionHierarchy:
+    """
+    CH của 1 weather trên dense node idx (graph.node_index)
+
+    Mỗi CH edge k: edge_from[k] → edge_to[k]; edge gốc có edge_orig[k] = edge_idx CSR,
+    shortcut có edge_orig[k] = -1 và 2 nửa edge_first[k], edge_second[k] (CH edge id)
+    """
+    __slots__ = (
+        'rank', 'up_fwd', 'up_bwd',
+        'edge_from', 'edge_to', 'edge_orig', 'edge_first', 'edge_second'
+    )
+
+    def __init__(self):
+        self.rank: List[int] = []
+        # up_fwd[u]: (v, w, k) với edge u → v, rank[v] > rank[u]
+        # up_bwd[v]: (u, w, k) với edge u → v, rank[u] > rank[v] (duyệt ngược từ đích)
+        self.up_fwd: List[List[Tuple[int, float, int]]] = []
+        self.up_bwd: List[List[Tuple[int, float, int]]] = []
+        self.edge_from: List[int] = []
+        self.edge_to: List[int] = []
+        self.edge_orig: List[int] = []
+        self.edge_first: List[int] = []
+        self.edge_second: List[int] = []
+
+    @classmethod
+    def build(cls, indptr: np.ndarray, indices: np.ndarray, weights: List[float]) -> "ContractionHierarchy":
+        """
+        Contract toàn bộ node theo edge difference (lazy update)
+
+        Args:
+            indptr, indices: CSR của graph (dense idx)
+            weights: weight theo edge_idx (graph.weights_for(weather))
+        """
+        ch = cls()
+        n = len(indptr) - 1
+
+        # Graph còn lại (node chưa contract): out_edges[u][v] / in_edges[v][u] = (w, CH edge id)
+        # Edge song song giữ weight nhỏ nhất
+        out_edges = [dict() for _ in range(n)]
+        in_edges = [dict() for _ in range(n)]
+        indptr_list = indptr.tolist()
+        indices_list = indices.tolist()
+        for u in range(n):
+            for edge_idx in range(indptr_list[u], indptr_list[u + 1]):
+                v = indices_list[edge_idx]
+                w = weights[edge_idx]
+                if v == u or not w < math.inf:
+                    continue
+                current = out_edges[u].get(v)
+                if current is None or w < current[0]:
+                    k = ch._add_edge(u, v, edge_idx, -1, -1)
+                    out_edges[u][v] = in_edges[v][u] = (w, k)
+
+        ch.rank = [0] * n
+        ch.up_fwd = [[] for _ in range(n)]
+        ch.up_bwd = [[] for _ in range(n)]
+        contracted = bytearray(n)
+        deleted_neighbors = [0] * n
+
+        heap = [(ch._priority(v, out_edges, in_edges, deleted_neighbors)[0], v) for v in range(n)]
+        heapq.heapify(heap)
+
+        next_rank = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            if contracted[v]:
+                continue
+            # Lazy update: tính lại priority, còn lớn hơn đỉnh heap thì đẩy lại
+            priority, shortcuts = ch._priority(v, out_edges, in_edges, deleted_neighbors)
+            if heap and priority > heap[0][0]:
+                heapq.heappush(heap, (priority, v))
+                continue
+
+            ch.rank[v] = next_rank
+            next_rank += 1
+            contracted[v] = 1
+
+            # Edge còn lại của v đều nối tới node rank cao hơn → thuộc graph "đi lên"
+            for x, (w, k) in out_edges[v].items():
+                ch.up_fwd[v].append((x, w, k))
+                del in_edges[x][v]
+                deleted_neighbors[x] += 1
+            for u, (w, k) in in_edges[v].items():
+                ch.up_bwd[v].append((u, w, k))
+                del out_edges[u][v]
+                deleted_neighbors[u] += 1
+
+            for u, x, w, k_in, k_out in shortcuts:
+                current = out_edges[u].get(x)
+                if current is None or w < current[0]:
+                    k = ch._add_edge(u, x, -1, k_in, k_out)
+                    out_edges[u][x] = in_edges[x][u] = (w, k)
+            out_edges[v] = {}
+            in_edges[v] = {}
+
+        return ch
+
+    def _add_edge(self, frm: int, to: int, orig: int, first: int, second: int) -> int:
+        self.edge_from.append(frm)
+        self.edge_to.append(to)
+        self.edge_orig.append(orig)
+        self.edge_first.append(first)
+        self.edge_second.append(second)
+        return len(self.edge_to) - 1
+
+    @staticmethod
+    def _priority(v, out_edges, in_edges, deleted_neighbors):
+        """
+        Edge difference của v: số shortcut cần thêm - số edge bị bỏ + số neighbor đã contract
+        Trả kèm danh sách shortcut (u, x, w, k_in, k_out) để contract ngay không phải tìm lại
+        """
+        shortcuts = []
+        outs = out_edges[v]
+        for u, (w_in, k_in) in in_edges[v].items():
+            targets = {x: w_in + w_out for x, (w_out, _) in outs.items() if x != u}
+            if not targets:
+                continue
+            witness = _witness_search(u, v, targets, max(targets.values()), out_edges)
+            for x, w in targets.items():
+                if witness.get(x, math.inf) > w:
+                    shortcuts.append((u, x, w, k_in, outs[x][1]))
+        priority = len(shortcuts) - len(outs) - len(in_edges[v]) + deleted_neighbors[v]
+        return priority, shortcuts
+
+    def query(self, start_idx: int, end_idx: int) -> Tuple[float, Optional[List[int]], int]:
+        """
+        Dijkstra 2 chiều trên graph đi lên
+
+        Returns:
+            (cost, edge_ids, nodes_settled) - edge_ids (edge_idx gốc theo thứ tự đi) là None nếu không có đường
+        """
+        if start_idx == end_idx:
+            return 0.0, [], 0
+
+        inf = math.inf
+        heappush, heappop = heapq.heappush, heapq.heappop
+        dist_fwd = {start_idx: 0.0}
+        dist_bwd = {end_idx: 0.0}
+        parent_fwd = {start_idx: -1}  # node → CH edge đi vào node
+        parent_bwd = {end_idx: -1}    # node → CH edge đi ra khỏi node (về phía đích)
+        open_fwd = [(0.0, start_idx)]
+        open_bwd = [(0.0, end_idx)]
+        settled_fwd = set()
+        settled_bwd = set()
+        mu, meet = inf, -1
+        nodes_settled = 0
+        up_fwd, up_bwd = self.up_fwd, self.up_bwd
+
+        while open_fwd or open_bwd:
+            # Mỗi hướng dừng khi key nhỏ nhất ≥ mu; hết cả 2 thì xong
+            if open_fwd and open_fwd[0][0] >= mu:
+                open_fwd = []
+            if open_bwd and open_bwd[0][0] >= mu:
+                open_bwd = []
+            if not open_fwd and not open_bwd:
+                break
+
+            forward = bool(open_fwd) and (not open_bwd or open_fwd[0][0] <= open_bwd[0][0])
+            if forward:
+                open_set, dist, other, parent, settled, rows = open_fwd, dist_fwd, dist_bwd, parent_fwd, settled_fwd, up_fwd
+            else:
+                open_set, dist, other, parent, settled, rows = open_bwd, dist_bwd, dist_fwd, parent_bwd, settled_bwd, up_bwd
+
+            d, current = heappop(open_set)
+            if current in settled:
+                continue
+            settled.add(current)
+            nodes_settled += 1
+
+            total = d + other.get(current, inf)
+            if total < mu:
+                mu, meet = total, current
+
+            for neighbor, w, k in rows[current]:
+                nd = d + w
+                if nd < dist.get(neighbor, inf):
+                    dist[neighbor] = nd
+                    parent[neighbor] = k
+                    heappush(open_set, (nd, neighbor))
+
+        if meet < 0:
+            return inf, None, nodes_settled
+
+        # Chuỗi CH edge: start → meet (đảo từ parent_fwd), meet → end (theo parent_bwd)
+        ch_edges = []
+        node = meet
+        while parent_fwd[node] >= 0:
+            k = parent_fwd[node]
+            ch_edges.append(k)
+            node = self.edge_from[k]
+        ch_edges.reverse()
+        node = meet
+        while parent_bwd[node] >= 0:
+            k = parent_bwd[node]
+            ch_edges.append(k)
+            node = self.edge_to[k]
+
+        return mu, self._unpack(ch_edges), nodes_settled
+
+    def _unpack(self, ch_edges: List[int]) -> List[int]:
+        """Unpack shortcut đệ quy (bằng stack) về chuỗi edge_idx gốc theo thứ tự đi"""
+        edge_orig, edge_first, edge_second = self.edge_orig, self.edge_first, self.edge_second
+        result = []
+        stack = list(reversed(ch_edges))
+        while stack:
+            k = stack.pop()
+            orig = edge_orig[k]
+            if orig >= 0:
+                result.append(orig)
+            else:
+                stack.append(edge_second[k])
+                stack.append(edge_first[k])
+        return result
+
+
+def _witness_search(source, skip, targets, max_cost, out_edges) -> dict:
+    """
+    Dijkstra giới hạn từ source trên graph còn lại, bỏ qua node đang contract (skip)
+    Dừng khi vượt max_cost, settle đủ WITNESS_SETTLE_LIMIT node hoặc đã settle hết targets
+    """
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = set()
+    remaining = len(targets)
+    while heap and len(settled) < WITNESS_SETTLE_LIMIT:
+        d, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        if d > max_cost:
+            break
+        settled.add(u)
+        if u in targets:
+            remaining -= 1
+            if remaining == 0:
+                break
+        for v, (w, _) in out_edges[u].items():
+            if v == skip:
+                continue
+            nd = d + w
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
@@ -7,23 +7,41 @@ Service pathfinding tối ưu
 - Local geocoding với SQLite FTS5
 """
 import heapq
+import math
+import os
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from itertools import chain
-from typing import List, Dict, Tuple, Optional, Set, Any
+from types import MappingProxyType
+from typing import List, Dict, Tuple, Optional, Set, Any, Sequence, NamedTuple
 from dataclasses import dataclass
-from shapely.geometry import LineString, shape
+import numpy as np
+import orjson
+import shapely
+from scipy.sparse.csgraph import dijkstra
+from shapely.geometry import LineString, Point, shape
 
 from .graph_builder import (
-    LightGraph, GraphNode, GraphEdge,
-    haversine_distance, build_graph_from_osm, C_CONTEXT
+    LightGraph, GraphEdge,
+    haversine_distance, build_graph_from_osm, C_CONTEXT,
+    save_graph, load_graph
 )
-from shapely.geometry import shape
-from .overpass_service import fetch_from_overpass, OSMData
+from .overpass_service import fetch_from_overpass, OSMData, CACHE_DIR, _get_cache_key
 from .local_geocoding_service import (
     init_local_geocoding, get_geocoding_db,
     LocalGeocodingDB, SearchResult
 )
 
+# Numba (optional, fallback về vòng lặp A* thuần Python nếu không có)
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
 
 @dataclass(slots=True)
 class PathResult:
@@ -37,15 +55,50 @@ class PathResult:
     stats: dict = None
 
 
-def heuristic(node1: GraphNode, node2: GraphNode) -> float:
-    """Heuristic admissible: khoảng cách × hệ số min"""
-    return haversine_distance(node1.lat, node1.lon, node2.lat, node2.lon) * 0.7
+class AstarOutcome(NamedTuple):
+    """
+    Kết quả nội bộ của A* (tuple primitives, không dict stats)
+    PathResult/dict response chỉ dựng ở entrypoint public
+    """
+    success: bool
+    path: Optional[List[int]]
+    distance: float
+    duration: float
+    geometry: Optional[List[Tuple[float, float]]]
+    nodes_visited: int
+    elapsed: Optional[float]  # giây; None = bị từ chối trước khi search (không có stats)
+    algorithm: str
+    error: Optional[str]
+
+
+def _rejected(error: str) -> AstarOutcome:
+    return AstarOutcome(False, None, 0.0, 0.0, None, 0, None, "", error)
+
+
+def _outcome_stats(outcome: AstarOutcome, weather: str) -> Optional[dict]:
+    if outcome.elapsed is None:
+        return None
+    if not outcome.success:
+        return {"nodes_visited": outcome.nodes_visited, "search_time_ms": outcome.elapsed * 1000}
+    return {
+        "nodes_visited": outcome.nodes_visited,
+        "search_time_ms": outcome.elapsed * 1000,
+        "path_length": len(outcome.path),
+        "algorithm": outcome.algorithm,
+        "weather": weather
+    }
+
+
+# Mét trên một độ kinh/vĩ (R Trái Đất như haversine_distance) × hệ số min 0.7 của heuristic.
+# Equirectangular (1 cos / query, không trig theo node): sai số < 0.01% ở phạm vi vài km,
+# nhanh hơn chord ECEF (3 trục) khi tính vectorized, hệ số 0.7 giữ h dưới chi phí thật
+_H_SCALE = math.radians(1.0) * 6371000 * 0.7
 
 
 def _merge_geometries(edges: List[GraphEdge], graph: LightGraph = None, path_nodes: List[int] = None) -> List[Tuple[float, float]]:
     """
     Merge geometry từ nhiều edges sử dụng REAL geometry từ edges
-    Logic chuẩn xác: Theo dõi current_node để xác định chiều đúng của mỗi edge
+    Theo dõi current_node để chọn forward/reverse geometry (đã dựng sẵn trên edge)
     
     Args:
         edges: Danh sách các edges trong path
@@ -58,233 +111,144 @@ def _merge_geometries(edges: List[GraphEdge], graph: LightGraph = None, path_nod
     if not edges:
         return []
     
-    def calc_dist(p1: Tuple[float, float], p2: Tuple[float, float]) -> float:
-        """Tính khoảng cách giữa 2 điểm (lon, lat) - dùng Euclidean đơn giản cho so sánh"""
-        return ((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2) ** 0.5
-    
-    result = []
+    # Lượt 1: chọn segment đúng chiều + đánh dấu segment nối liền đoạn trước (bỏ điểm đầu trùng)
+    segments: List[List[Tuple[float, float]]] = []
+    joined: List[bool] = []
+    last_point = None
     
     # Xác định start_node từ path_nodes hoặc edge đầu tiên
-    if path_nodes and len(path_nodes) > 0:
+    if path_nodes:
         current_node = path_nodes[0]
-    elif edges:
+    else:
         # Nếu không có path_nodes, giả định edge đầu tiên đi từ from_node
         current_node = edges[0].from_node
-    else:
-        return []
     
-    for i, edge in enumerate(edges):
-        if edge.geometry and len(edge.geometry) >= 2:
-            # Edge có real geometry
-            segment = list(edge.geometry)
-            
-            # KIỂM TRA HƯỚNG: Đây là chỗ quan trọng nhất
-            if edge.from_node == current_node:
-                # Cạnh thuận chiều: [from_node -> to_node]
-                # Không cần reverse, điểm tiếp theo sẽ là to_node
-                current_node = edge.to_node
-            elif edge.to_node == current_node:
-                # Cạnh ngược chiều: [to_node -> from_node]
-                # PHẢI REVERSE để có thứ tự điểm từ current_node đi ra
+    for edge in edges:
+        # Chiều của edge xác định bởi node đang đứng: ngược chiều khi đi vào từ to_node
+        backward = edge.to_node == current_node and edge.from_node != current_node
+        current_node = edge.from_node if backward else edge.to_node
+        
+        if len(edge.geometry) >= 2:
+            segment = edge.reverse_geometry if backward else edge.forward_geometry
+        elif graph:
+            # Edge không có geometry: tạo từ nodes (fallback)
+            from_node = graph.get_node(edge.from_node)
+            to_node = graph.get_node(edge.to_node)
+            if not (from_node and to_node):
+                continue
+            segment = [(from_node.lon, from_node.lat), (to_node.lon, to_node.lat)]
+            if backward:
                 segment.reverse()
-                current_node = edge.from_node
-            else:
-                # Edge không nối với current_node - có thể do lỗi path
-                # Fallback: dùng khoảng cách để xác định chiều
-                if graph:
-                    current_node_obj = graph.get_node(current_node)
-                    from_node_obj = graph.get_node(edge.from_node)
-                    to_node_obj = graph.get_node(edge.to_node)
-                    
-                    if current_node_obj and from_node_obj and to_node_obj:
-                        dist_to_from = calc_dist(
-                            (current_node_obj.lon, current_node_obj.lat),
-                            (from_node_obj.lon, from_node_obj.lat)
-                        )
-                        dist_to_to = calc_dist(
-                            (current_node_obj.lon, current_node_obj.lat),
-                            (to_node_obj.lon, to_node_obj.lat)
-                        )
-                        
-                        if dist_to_to < dist_to_from:
-                            # to_node gần hơn: edge đi từ from_node -> to_node, cần reverse
-                            segment.reverse()
-                            current_node = edge.from_node
-                        else:
-                            # from_node gần hơn: edge đi từ from_node -> to_node, đúng chiều
-                            current_node = edge.to_node
-            
-            # Nối vào đường tổng, bỏ điểm đầu để tránh duplicate với điểm cuối đoạn trước
-            if not result:
-                # Edge đầu tiên: thêm toàn bộ
-                result.extend(segment)
-            else:
-                # Các edge sau: skip điểm đầu nếu trùng với điểm cuối của result
-                last_p = result[-1]
-                if calc_dist(last_p, segment[0]) < 1e-6:  # Trùng điểm (tolerance nhỏ)
-                    result.extend(segment[1:])
-                else:
-                    result.extend(segment)
         else:
-            # Edge không có geometry: tạo từ nodes (fallback)
-            if graph:
-                from_node = graph.get_node(edge.from_node)
-                to_node = graph.get_node(edge.to_node)
-                if from_node and to_node:
-                    from_coord = (from_node.lon, from_node.lat)
-                    to_coord = (to_node.lon, to_node.lat)
-                    
-                    # Kiểm tra hướng
-                    if edge.from_node == current_node:
-                        # Thuận chiều: from_node -> to_node
-                        segment_coords = [from_coord, to_coord]
-                        current_node = edge.to_node
-                    elif edge.to_node == current_node:
-                        # Ngược chiều: to_node -> from_node, cần reverse
-                        segment_coords = [to_coord, from_coord]
-                        current_node = edge.from_node
-                    else:
-                        # Fallback: dùng khoảng cách
-                        current_node_obj = graph.get_node(current_node)
-                        if current_node_obj:
-                            dist_to_from = calc_dist(
-                                (current_node_obj.lon, current_node_obj.lat),
-                                from_coord
-                            )
-                            dist_to_to = calc_dist(
-                                (current_node_obj.lon, current_node_obj.lat),
-                                to_coord
-                            )
-                            
-                            if dist_to_to < dist_to_from:
-                                segment_coords = [to_coord, from_coord]
-                                current_node = edge.from_node
-                            else:
-                                segment_coords = [from_coord, to_coord]
-                                current_node = edge.to_node
-                        else:
-                            segment_coords = [from_coord, to_coord]
-                            current_node = edge.to_node
-                    
-                    # Nối vào result
-                    if not result:
-                        result.extend(segment_coords)
-                    else:
-                        last_p = result[-1]
-                        if calc_dist(last_p, segment_coords[0]) < 1e-6:
-                            result.extend(segment_coords[1:])
-                        else:
-                            result.extend(segment_coords)
+            continue
+        
+        # Bỏ điểm đầu nếu trùng điểm cuối đoạn trước
+        joined.append(last_point is not None and last_point == segment[0])
+        segments.append(segment)
+        last_point = segment[-1]
+    
+    # Lượt 2: cấp phát output 1 lần theo tổng độ dài, ghi từng slice (như _concat_segments)
+    result = [None] * (sum(map(len, segments)) - sum(joined))
+    pos = 0
+    for segment, skip_first in zip(segments, joined):
+        if skip_first:
+            k = len(segment) - 1
+            result[pos:pos + k] = segment[1:]
+        else:
+            k = len(segment)
+            result[pos:pos + k] = segment
+        pos += k
     
     return result
 
 
+def _trace_path(came_from, came_from_edge, start_idx, end_idx):
+    """
+    Đi ngược came_from/came_from_edge (theo dense idx) từ end về start
+    Thuần số trên mảng → compile được bằng numba như _astar_core
+    
+    Returns:
+        (path_idx, edge_ids) - int64 ndarray theo thứ tự start → end, len(edge_ids) = len(path_idx) - 1
+    """
+    n = 0
+    current = end_idx
+    while current != start_idx:
+        n += 1
+        current = came_from[current]
+    
+    path_idx = np.empty(n + 1, dtype=np.int64)
+    edge_ids = np.empty(n, dtype=np.int64)
+    current = end_idx
+    path_idx[n] = current
+    for i in range(n - 1, -1, -1):
+        edge_ids[i] = came_from_edge[current]
+        current = came_from[current]
+        path_idx[i] = current
+    return path_idx, edge_ids
+
+
+if HAS_NUMBA:
+    _trace_path_kernel = njit(cache=True, nogil=True)(_trace_path)
+else:
+    _trace_path_kernel = _trace_path
+
+
 def _reconstruct_path_with_geometry(
-    came_from: Dict[int, int],
-    came_from_edge: Dict[int, GraphEdge],
-    end_id: int,
-    graph: LightGraph
+    graph: LightGraph,
+    path_idx: Sequence[int],
+    edge_ids: List[int]
 ) -> Tuple[List[int], List[Tuple[float, float]], float, float]:
     """
-    Reconstruct path và xây dựng geometry trực tiếp - không merge
-    Đảm bảo path liên tục, không có gap
+    Dựng path (node ID), geometry, distance, duration từ kết quả _trace_path - không merge
+    Mỗi edge lấy luôn segment đúng chiều + cộng distance/duration, cuối cùng nối segment 1 lần
+    path_idx (ndarray hoặc list) → node ID bằng 1 lần gather trên _node_ids (cùng thứ tự dense idx)
     
     Returns:
         (path, geometry, distance, duration)
     """
-    # Reconstruct path từ end về start
-    path = []
-    current = end_id
-    while current is not None:
-        path.append(current)
-        current = came_from.get(current)
-    
-    path.reverse()  # Từ start đến end
-    
-    # Xây dựng geometry trực tiếp từ path
-    geometry = []
+    edges_by_idx = graph.edges_by_idx
+    path = graph._node_ids[path_idx].tolist()
+    segments = []
     total_dist = 0.0
     total_dur = 0.0
     
-    if len(path) < 2:
-        return path, geometry, total_dist, total_dur
-    
-    # Duyệt từng cặp node liên tiếp trong path
-    for i in range(len(path) - 1):
-        from_node_id = path[i]
-        to_node_id = path[i + 1]
-        
-        # Lấy edge từ came_from_edge
-        edge = came_from_edge.get(to_node_id)
-        
-        if not edge:
-            # Edge không tồn tại - path không liên tục (lỗi)
-            # Fallback: tạo geometry từ 2 nodes
-            from_node = graph.get_node(from_node_id)
-            to_node = graph.get_node(to_node_id)
-            if from_node and to_node:
-                if not geometry:
-                    geometry.append((from_node.lon, from_node.lat))
-                geometry.append((to_node.lon, to_node.lat))
-            continue
-        
-        # Validate: edge phải nối đúng from_node và to_node
-        if edge.from_node != from_node_id and edge.to_node != from_node_id:
-            # Edge không khớp với path - có thể do lỗi
-            # Fallback: tạo geometry từ nodes
-            from_node = graph.get_node(from_node_id)
-            to_node = graph.get_node(to_node_id)
-            if from_node and to_node:
-                if not geometry:
-                    geometry.append((from_node.lon, from_node.lat))
-                geometry.append((to_node.lon, to_node.lat))
-            continue
-        
-        # Xác định hướng edge
-        if edge.from_node == from_node_id:
-            # Edge đi từ from_node -> to_node (thuận chiều)
-            if edge.geometry and len(edge.geometry) >= 2:
-                # Sử dụng real geometry
-                segment = edge.geometry
-            else:
-                # Fallback: tạo từ nodes
-                from_node = graph.get_node(from_node_id)
-                to_node = graph.get_node(to_node_id)
-                if from_node and to_node:
-                    segment = [(from_node.lon, from_node.lat), (to_node.lon, to_node.lat)]
-                else:
-                    continue
+    for from_id, to_id, edge_idx in zip(path, path[1:], edge_ids):
+        edge = edges_by_idx[edge_idx]
+        if len(edge.geometry) < 2:
+            # Edge không có geometry: tạo từ 2 nodes
+            from_node, to_node = graph.nodes[from_id], graph.nodes[to_id]
+            segment = [(from_node.lon, from_node.lat), (to_node.lon, to_node.lat)]
+        elif edge.from_node == from_id:
+            # Thuận chiều from_node -> to_node
+            segment = edge.forward_geometry
         else:
-            # Edge đi từ to_node -> from_node (ngược chiều), cần reverse
-            if edge.geometry and len(edge.geometry) >= 2:
-                # Reverse geometry
-                segment = list(reversed(edge.geometry))
-            else:
-                # Fallback: tạo từ nodes (đã reverse)
-                from_node = graph.get_node(from_node_id)
-                to_node = graph.get_node(to_node_id)
-                if from_node and to_node:
-                    segment = [(from_node.lon, from_node.lat), (to_node.lon, to_node.lat)]
-                else:
-                    continue
-        
-        # Nối segment vào geometry (skip điểm đầu nếu trùng)
-        if not geometry:
-            geometry.extend(segment)
-        else:
-            # Kiểm tra điểm cuối của geometry và điểm đầu của segment
-            last_p = geometry[-1]
-            first_p = segment[0]
-            # Tolerance: 1e-6 độ (khoảng 0.1m)
-            if abs(last_p[0] - first_p[0]) < 1e-6 and abs(last_p[1] - first_p[1]) < 1e-6:
-                geometry.extend(segment[1:])
-            else:
-                geometry.extend(segment)
-        
+            # Ngược chiều: geometry đảo sẵn trên edge
+            segment = edge.reverse_geometry
+        segments.append(segment)
         total_dist += edge.length
         total_dur += edge.travel_time
     
-    return path, geometry, total_dist, total_dur
+    return path, _concat_segments(segments), total_dist, total_dur
+
+
+def _concat_segments(segments: Sequence[List[Tuple[float, float]]]) -> List[Tuple[float, float]]:
+    """
+    Nối các segment liên tiếp (điểm đầu mỗi segment trùng điểm cuối segment trước)
+    Cấp phát output 1 lần theo tổng độ dài đã biết, ghi từng slice - không extend/realloc
+    """
+    if not segments:
+        return []
+    total = sum(map(len, segments)) - (len(segments) - 1)
+    geometry = [None] * total
+    it = iter(segments)
+    first = next(it)
+    pos = len(first)
+    geometry[:pos] = first
+    for segment in it:
+        k = len(segment) - 1
+        geometry[pos:pos + k] = segment[1:]
+        pos += k
+    return geometry
 
 
 def _collect_edges_and_stats(
@@ -315,6 +279,211 @@ def _collect_edges_and_stats(
     return path, edges, total_dist, total_dur
 
 
+def _astar_core(indptr, indices, weights, h, start_idx, end_idx):
+    """
+    Kernel A* thuần số trên CSR (compile bằng numba nếu có)
+    weights đã áp policy, h = heuristic của mọi node tới end (_heuristic_array)
+    
+    Heap 4-ary có chỉ số trên mảng cấp phát sẵn (heap/pos/key) với decrease-key
+    thay cho heapq trên list tuple: không cấp phát trong vòng lặp, không entry stale.
+    4-ary: cây thấp bằng nửa heap nhị phân → sift-up (decrease-key, rất thường gặp)
+    ít bước hơn, 4 con nằm liền nhau trên mảng.
+    So sánh (f, idx) như _astar_loop (thứ tự toàn phần) → thứ tự pop và đường đi giống hệt
+    
+    Returns:
+        (found, nodes_visited, came_from, came_from_edge) - came_from/came_from_edge theo idx
+    """
+    n = indptr.shape[0] - 1
+    g_score = np.full(n, np.inf)
+    came_from = np.full(n, -1, dtype=np.int64)
+    came_from_edge = np.full(n, -1, dtype=np.int64)
+    closed = np.zeros(n, dtype=np.uint8)
+    
+    heap = np.empty(n, dtype=np.int64)         # node idx theo thứ tự heap
+    pos = np.full(n, -1, dtype=np.int64)       # vị trí node trong heap, -1 = không nằm trong heap
+    key = np.empty(n)                          # f của node đang nằm trong heap
+    
+    g_score[start_idx] = 0.0
+    heap[0] = start_idx
+    pos[start_idx] = 0
+    key[start_idx] = 0.0
+    size = 1
+    nodes_visited = 0
+    
+    while size > 0:
+        # Pop gốc, đưa phần tử cuối lên rồi sift-down
+        current = heap[0]
+        pos[current] = -1
+        size -= 1
+        if size > 0:
+            last = heap[size]
+            last_f = key[last]
+            i = 0
+            while True:
+                first = 4 * i + 1
+                if first >= size:
+                    break
+                # Con nhỏ nhất trong tối đa 4 con heap[first:first + 4]
+                child = first
+                c = heap[first]
+                for j in range(first + 1, min(first + 4, size)):
+                    r = heap[j]
+                    if key[r] < key[c] or (key[r] == key[c] and r < c):
+                        child = j
+                        c = r
+                if key[c] < last_f or (key[c] == last_f and c < last):
+                    heap[i] = c
+                    pos[c] = i
+                    i = child
+                else:
+                    break
+            heap[i] = last
+            pos[last] = i
+        
+        nodes_visited += 1
+        if current == end_idx:
+            return True, nodes_visited, came_from, came_from_edge
+        closed[current] = 1
+        current_g = g_score[current]
+        
+        for k in range(indptr[current], indptr[current + 1]):
+            neighbor = indices[k]
+            if closed[neighbor]:
+                continue
+            tentative_g = current_g + weights[k]
+            if tentative_g < g_score[neighbor]:
+                came_from[neighbor] = current
+                came_from_edge[neighbor] = k
+                g_score[neighbor] = tentative_g
+                
+                # Push hoặc decrease-key (f chỉ giảm vì h cố định), rồi sift-up
+                f = tentative_g + h[neighbor]
+                i = pos[neighbor]
+                if i < 0:
+                    i = size
+                    size += 1
+                key[neighbor] = f
+                while i > 0:
+                    parent = (i - 1) >> 2
+                    p = heap[parent]
+                    if key[p] < f or (key[p] == f and p < neighbor):
+                        break
+                    heap[i] = p
+                    pos[p] = i
+                    i = parent
+                heap[i] = neighbor
+                pos[neighbor] = i
+    
+    return False, nodes_visited, came_from, came_from_edge
+
+
+if HAS_NUMBA:
+    # nogil: kernel chỉ chạm mảng numpy → nhả GIL, các query trên executor "routing" chạy song song thật
+    _astar_core = njit(cache=True, nogil=True)(_astar_core)
+
+
+def _heuristic_array(
+    graph: LightGraph,
+    target_idx: int,
+    weather: str,
+    use_alt: bool = True,
+    reverse: bool = False
+) -> np.ndarray:
+    """
+    Heuristic của mọi node, tính vectorized 1 lần cho query:
+    max(equirectangular × hệ số min, ALT landmark) - cả 2 admissible + consistent nên max cũng vậy
+    
+    reverse=False: cận dưới d(v, target); reverse=True: cận dưới d(target, v) (hướng ngược của bidirectional)
+    """
+    lat_arr, lon_arr = graph.lat_arr, graph.lon_arr
+    lat, lon = float(lat_arr[target_idx]), float(lon_arr[target_idx])
+    kx = math.cos(math.radians(lat))
+    dy = lat_arr - lat
+    dx = (lon_arr - lon) * kx
+    h = np.sqrt(dx * dx + dy * dy) * _H_SCALE
+    
+    if use_alt and graph.landmark_idx is not None:
+        dist_from, dist_to = graph.landmark_distances(weather)
+        # d(v,t) >= d(L,t) - d(L,v) và d(v,t) >= d(v,L) - d(t,L) (đổi vai v/t khi reverse)
+        if reverse:
+            alt = np.maximum(
+                (dist_from - dist_from[:, target_idx, None]).max(axis=0),
+                (dist_to[:, target_idx, None] - dist_to).max(axis=0)
+            )
+        else:
+            alt = np.maximum(
+                (dist_from[:, target_idx, None] - dist_from).max(axis=0),
+                (dist_to - dist_to[:, target_idx, None]).max(axis=0)
+            )
+        np.maximum(h, alt, out=h)
+    return h
+
+
+class AstarContext:
+    """
+    Scratch structures của A* dùng lại giữa các query (reset thay vì cấp phát mới)
+    Mỗi thread một context (xem _get_astar_context) vì routing chạy trên thread pool
+    
+    g_score/came_from là list theo dense node idx (graph.node_index), closed là bytearray
+    """
+    __slots__ = ('open_set', 'g_score', 'came_from', 'came_from_edge', 'closed', '_inf_row')
+    
+    def __init__(self):
+        self.open_set: List[Tuple[float, int]] = []
+        self.g_score: List[float] = []
+        self.came_from: List[int] = []
+        self.came_from_edge: List[int] = []  # edge_idx
+        self.closed = bytearray()
+        self._inf_row: List[float] = []
+    
+    def reset(self, n: int):
+        self.open_set.clear()
+        if len(self.g_score) != n:
+            self._inf_row = [math.inf] * n
+            self.g_score = self._inf_row[:]
+            self.came_from = [-1] * n
+            self.came_from_edge = [-1] * n
+            self.closed = bytearray(n)
+            return
+        # came_from/came_from_edge chỉ được đọc ở node đã có g_score → không cần xóa
+        self.g_score[:] = self._inf_row
+        self.closed[:] = bytes(n)
+
+
+def _astar_found(
+    graph: LightGraph,
+    came_from,
+    came_from_edge,
+    start_idx: int,
+    end_idx: int,
+    nodes_visited: int,
+    start_time: float,
+    algorithm: str
+) -> AstarOutcome:
+    """Kết quả thành công: reconstruct path/geometry từ came_from theo idx"""
+    # came_from là ndarray khi chạy kernel numba → trace trong kernel; path_idx giữ nguyên
+    # ndarray int64 để gather node ID, chỉ .tolist() edge_ids (index vào edges_by_idx)
+    trace = _trace_path_kernel if isinstance(came_from, np.ndarray) else _trace_path
+    path_idx, edge_ids = trace(came_from, came_from_edge, start_idx, end_idx)
+    path, geometry, dist, dur = _reconstruct_path_with_geometry(graph, path_idx, edge_ids.tolist())
+    elapsed = time.perf_counter() - start_time
+    return AstarOutcome(True, path, dist, dur, geometry, nodes_visited, elapsed, algorithm, None)
+
+
+_astar_local = threading.local()
+
+# Singleton rỗng (read-only) cho query không có vùng ngập/chặn
+_EMPTY_SET: frozenset = frozenset()
+_EMPTY_MAP = MappingProxyType({})
+
+
+def _get_astar_context() -> AstarContext:
+    ctx = getattr(_astar_local, "ctx", None)
+    if ctx is None:
+        ctx = _astar_local.ctx = AstarContext()
+    return ctx
+
+
 def astar_search(
     graph: LightGraph,
     start_id: int,
@@ -322,7 +491,8 @@ def astar_search(
     weather: str = "normal",
     penalty_map: Dict[Tuple[int, int], float] = None,
     blocked_edges: Set[Tuple[int, int]] = None,
-    blocked_nodes: Set[int] = None
+    blocked_nodes: Set[int] = None,
+    ctx: Optional[AstarContext] = None
 ) -> PathResult:
     """
     One-directional A* search - tối ưu, xây dựng geometry trực tiếp, không merge
@@ -334,6 +504,7 @@ def astar_search(
         penalty_map: Dict[(from, to)] -> multiplier cho flood areas
         blocked_edges: Set[(from, to)] - edges bị chặn hoàn toàn
         blocked_nodes: Set[int] - nodes bị chặn (ngã 3, ngã 4) - phong tỏa nút giao
+        ctx: AstarContext dùng lại (mặc định: context của thread hiện tại)
     
     Performance:
         - Không copy graph
@@ -341,118 +512,297 @@ def astar_search(
         - Blocked check: O(1) cho cả edges và nodes
         - Geometry được xây dựng trực tiếp trong reconstruct, không merge
     """
+    outcome = _astar_run(graph, start_id, end_id, weather, penalty_map, blocked_edges, blocked_nodes, ctx)
+    return PathResult(
+        success=outcome.success,
+        path=outcome.path,
+        distance=outcome.distance,
+        duration=outcome.duration,
+        geometry=outcome.geometry,
+        error=outcome.error,
+        stats=_outcome_stats(outcome, weather)
+    )
+
+
+def astar_batch(
+    graph: LightGraph,
+    pairs: List[Tuple[int, int]],
+    weather: str = "normal",
+    n_workers: Optional[int] = None,
+    penalty_map: Dict[Tuple[int, int], float] = None,
+    blocked_edges: Set[Tuple[int, int]] = None,
+    blocked_nodes: Set[int] = None
+) -> List[PathResult]:
+    """
+    A* cho nhiều cặp (start_id, end_id) - one-to-many / matrix routing
+    
+    Graph chỉ được đọc, mỗi thread dùng AstarContext riêng (thread-local) → chạy song song an toàn.
+    Chỉ có lợi khi kernel nhả GIL (numba nogil), nên mặc định 1 worker nếu không có numba
+    
+    Returns:
+        List[PathResult] cùng thứ tự với pairs
+    """
+    # Build index/weights trước khi chia thread (tránh nhiều thread cùng build lazy)
+    if graph.adjacency_by_idx is None:
+        graph.build_node_index()
+    graph.weights_for(weather)
+    if HAS_NUMBA:
+        graph.weights_array_for(weather)
+    
+    def run(pair: Tuple[int, int]) -> PathResult:
+        return astar_search(graph, pair[0], pair[1], weather, penalty_map, blocked_edges, blocked_nodes)
+    
+    if n_workers is None:
+        n_workers = (os.cpu_count() or 1) if HAS_NUMBA else 1
+    if n_workers <= 1 or len(pairs) <= 1:
+        return [run(pair) for pair in pairs]
+    with ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix="astar") as pool:
+        return list(pool.map(run, pairs))
+
+
+def cost_matrix(
+    graph: LightGraph,
+    source_ids: Sequence[int],
+    target_ids: Sequence[int],
+    weather: str = "normal"
+) -> np.ndarray:
+    """
+    Ma trận chi phí đường ngắn nhất (cùng đơn vị weight của A*) - cho TSP/giao hàng/isochrone
+    
+    Không chạy A* cho từng cặp: Dijkstra một-tới-tất-cả (scipy csgraph, C) từ phía ít điểm hơn,
+    phía nguồn trên graph thuận, phía đích trên graph đảo chiều
+    
+    Returns:
+        ndarray (len(source_ids), len(target_ids)); inf nếu không có đường hoặc node không tồn tại
+    """
+    result = np.full((len(source_ids), len(target_ids)), np.inf)
+    if not len(source_ids) or not len(target_ids):
+        return result
+    if graph.adjacency_by_idx is None:
+        graph.build_node_index()
+    node_index = graph.node_index
+    
+    # Node không tồn tại: giữ hàng/cột inf
+    src_pos = [i for i, node_id in enumerate(source_ids) if node_id in node_index]
+    dst_pos = [j for j, node_id in enumerate(target_ids) if node_id in node_index]
+    if not src_pos or not dst_pos:
+        return result
+    src_idx = [node_index[source_ids[i]] for i in src_pos]
+    dst_idx = [node_index[target_ids[j]] for j in dst_pos]
+    
+    matrix = graph._weight_matrix(weather)
+    if len(src_idx) <= len(dst_idx):
+        dist = dijkstra(matrix, directed=True, indices=src_idx)[:, dst_idx]
+    else:
+        dist = dijkstra(matrix.T.tocsr(), directed=True, indices=dst_idx)[:, src_idx].T
+    result[np.ix_(src_pos, dst_pos)] = dist
+    return result
+
+
+def _astar_run(
+    graph: LightGraph,
+    start_id: int,
+    end_id: int,
+    weather: str = "normal",
+    penalty_map: Dict[Tuple[int, int], float] = None,
+    blocked_edges: Set[Tuple[int, int]] = None,
+    blocked_nodes: Set[int] = None,
+    ctx: Optional[AstarContext] = None
+) -> AstarOutcome:
+    """Thân của astar_search, trả AstarOutcome (dùng trực tiếp bởi FastRoutingService)"""
     start_time = time.perf_counter()
     
     if not graph.has_node(start_id) or not graph.has_node(end_id):
-        return PathResult(success=False, error="Start hoặc end node không tồn tại")
+        return _rejected("Start hoặc end node không tồn tại")
     
     # Kiểm tra start/end có bị block không
     if blocked_nodes:
         if start_id in blocked_nodes:
-            return PathResult(success=False, error="Điểm bắt đầu nằm trong vùng cấm")
+            return _rejected("Điểm bắt đầu nằm trong vùng cấm")
         if end_id in blocked_nodes:
-            return PathResult(success=False, error="Điểm kết thúc nằm trong vùng cấm")
+            return _rejected("Điểm kết thúc nằm trong vùng cấm")
     
-    start_node = graph.get_node(start_id)
-    end_node = graph.get_node(end_id)
-    
-    # Default empty collections
+    # Default empty collections: singleton read-only, không cấp phát set/dict mỗi query
     if penalty_map is None:
-        penalty_map = {}
+        penalty_map = _EMPTY_MAP
     if blocked_edges is None:
-        blocked_edges = set()
+        blocked_edges = _EMPTY_SET
     if blocked_nodes is None:
-        blocked_nodes = set()
+        blocked_nodes = _EMPTY_SET
+    
+    if graph.adjacency_by_idx is None:
+        graph.build_node_index()
+    node_index = graph.node_index
+    start_idx = node_index[start_id]
+    end_idx = node_index[end_id]
+    
+    # Weight theo edge_idx (weather cố định trong query); có vùng ngập/chặn thì áp policy vào bản copy
+    has_policy = bool(penalty_map or blocked_edges or blocked_nodes)
+    if has_policy:
+        weights_arr = _policy_weights(graph, weather, penalty_map, blocked_edges, blocked_nodes)
     
-    # Priority queue: (f_score, counter, node_id)
-    counter = 0
-    open_set = [(0.0, counter, start_id)]
+    # ALT chỉ admissible khi penalty không làm giảm weight (multiplier >= 1)
+    use_alt = not penalty_map or min(penalty_map.values()) >= 1.0
+    h = _heuristic_array(graph, end_idx, weather, use_alt)
     
-    came_from: Dict[int, int] = {}
-    came_from_edge: Dict[int, GraphEdge] = {}
-    g_score: Dict[int, float] = {start_id: 0.0}
+    if HAS_NUMBA:
+        # Kernel numba trên CSR
+        if not has_policy:
+            weights_arr = graph.weights_array_for(weather)
+        found, nodes_visited, came_from, came_from_edge = _astar_core(
+            graph.csr_indptr, graph.csr_indices, weights_arr, h, start_idx, end_idx
+        )
+        algorithm = "astar_numba"
+    else:
+        # Scratch structures dùng lại giữa các query
+        if ctx is None:
+            ctx = _get_astar_context()
+        ctx.reset(len(node_index))
+        weights = weights_arr.tolist() if has_policy else graph.weights_for(weather)
+        found, nodes_visited = _astar_loop(graph, ctx, start_idx, end_idx, weights, h.tolist())
+        came_from, came_from_edge = ctx.came_from, ctx.came_from_edge
+        algorithm = "astar_optimized"
     
-    open_set_hash: Set[int] = {start_id}
-    closed_set: Set[int] = set()
+    if found:
+        return _astar_found(
+            graph, came_from, came_from_edge, start_idx, end_idx,
+            nodes_visited, start_time, algorithm
+        )
+    
+    elapsed = time.perf_counter() - start_time
+    return AstarOutcome(False, None, 0.0, 0.0, None, nodes_visited, elapsed, "", "Không tìm thấy đường đi")
+
+
+def _ch_run(
+    graph: LightGraph,
+    start_id: int,
+    end_id: int,
+    weather: str = "normal"
+) -> Optional[AstarOutcome]:
+    """
+    Query trên Contraction Hierarchies (chỉ khi không có vùng ngập/chặn)
+    Trả None nếu graph chưa có CH của weather → caller chạy A*
+    """
+    start_time = time.perf_counter()
+    ch = graph.contraction_for(weather)
+    if ch is None or not graph.has_node(start_id) or not graph.has_node(end_id):
+        return None
+    
+    start_idx = graph.node_index[start_id]
+    _, edge_ids, nodes_settled = ch.query(start_idx, graph.node_index[end_id])
+    if edge_ids is None:
+        elapsed = time.perf_counter() - start_time
+        return AstarOutcome(False, None, 0.0, 0.0, None, nodes_settled, elapsed, "", "Không tìm thấy đường đi")
+    
+    # Node kế tiếp của mỗi edge = csr_indices[edge_idx]
+    path_idx = [start_idx]
+    path_idx.extend(graph.csr_indices[edge_ids].tolist())
+    path, geometry, dist, dur = _reconstruct_path_with_geometry(graph, path_idx, edge_ids)
+    elapsed = time.perf_counter() - start_time
+    return AstarOutcome(True, path, dist, dur, geometry, nodes_settled, elapsed, "contraction_hierarchies", None)
+
+
+def _astar_loop(
+    graph: LightGraph,
+    ctx: AstarContext,
+    start_idx: int,
+    end_idx: int,
+    weights: List[float],
+    h: List[float]
+) -> Tuple[bool, int]:
+    """
+    Vòng lặp A* trên weights theo edge_idx (policy đã áp sẵn) và heuristic tính sẵn cho mọi node
+    Ghi came_from/came_from_edge vào ctx
+    
+    Returns:
+        (found, nodes_visited)
+    """
+    # Priority queue: (f_score, node_idx) - hòa f thì so idx (dense int duy nhất), không cần counter
+    open_set = ctx.open_set
+    open_set.append((0.0, start_idx))
+    
+    came_from = ctx.came_from
+    came_from_edge = ctx.came_from_edge
+    g_score = ctx.g_score
+    g_score[start_idx] = 0.0
+    
+    closed = ctx.closed
     nodes_visited = 0
     
+    # Bind local: hàm heap, list theo idx của graph
+    adjacency = graph.adjacency_by_idx
+    heappush, heappop = heapq.heappush, heapq.heappop
+    
     while open_set:
-        _, _, current = heapq.heappop(open_set)
+        _, current = heappop(open_set)
         
-        if current in closed_set:
+        # Lazy decrease-key: node có thể nằm nhiều lần trong heap, entry đầu tiên pop ra là tốt nhất.
+        # Entry stale (f > g + h) luôn pop sau entry tốt hơn của cùng node → đã closed, check này đủ
+        # làm stale guard, không cần so f với g_score + h
+        if closed[current]:
             continue
         
-        open_set_hash.discard(current)
         nodes_visited += 1
         
-        if current == end_id:
-            elapsed = time.perf_counter() - start_time
-            # Reconstruct path và geometry trực tiếp - không merge
-            path, geometry, dist, dur = _reconstruct_path_with_geometry(
-                came_from, came_from_edge, end_id, graph
-            )
-            
-            return PathResult(
-                success=True,
-                path=path,
-                distance=dist,
-                duration=dur,
-                geometry=geometry,
-                stats={
-                    "nodes_visited": nodes_visited,
-                    "search_time_ms": elapsed * 1000,
-                    "path_length": len(path),
-                    "algorithm": "astar_optimized",
-                    "weather": weather
-                }
-            )
+        if current == end_idx:
+            return True, nodes_visited
         
-        closed_set.add(current)
+        closed[current] = 1
         current_g = g_score[current]
         
-        for neighbor_id, edge in graph.get_neighbors(current):
-            if neighbor_id in closed_set:
-                continue
-            
-            edge_key = (current, neighbor_id)
-            
-            # O(1) check blocked edge
-            if edge_key in blocked_edges:
-                continue
-            
-            # O(1) check blocked node (ngã 3, ngã 4 bị phong tỏa)
-            # Nếu neighbor là một intersection bị chặn, không được đi vào
-            if neighbor_id in blocked_nodes:
+        for neighbor, _, edge_idx in adjacency[current]:
+            if closed[neighbor]:
                 continue
             
-            # Base weight
-            weight = edge.get_weight(weather)
-            
-            # O(1) penalty lookup
-            if edge_key in penalty_map:
-                weight *= penalty_map[edge_key]
-            
-            tentative_g = current_g + weight
+            tentative_g = current_g + weights[edge_idx]
             
-            if neighbor_id not in g_score or tentative_g < g_score[neighbor_id]:
-                came_from[neighbor_id] = current
-                came_from_edge[neighbor_id] = edge
-                g_score[neighbor_id] = tentative_g
+            if tentative_g < g_score[neighbor]:
+                came_from[neighbor] = current
+                came_from_edge[neighbor] = edge_idx
+                g_score[neighbor] = tentative_g
                 
-                neighbor_node = graph.get_node(neighbor_id)
-                f = tentative_g + heuristic(neighbor_node, end_node)
-                
-                if neighbor_id not in open_set_hash:
-                    counter += 1
-                    heapq.heappush(open_set, (f, counter, neighbor_id))
-                    open_set_hash.add(neighbor_id)
+                # Luôn push khi g cải thiện (entry cũ thành stale, bị bỏ qua khi pop)
+                heappush(open_set, (tentative_g + h[neighbor], neighbor))
     
-    elapsed = time.perf_counter() - start_time
-    return PathResult(
-        success=False,
-        error="Không tìm thấy đường đi",
-        stats={"nodes_visited": nodes_visited, "search_time_ms": elapsed * 1000}
-    )
+    return False, nodes_visited
+
+
+def _policy_weights(
+    graph: LightGraph,
+    weather: str,
+    penalty_map: Dict[Tuple[int, int], float],
+    blocked_edges: Set[Tuple[int, int]],
+    blocked_nodes: Set[int]
+) -> np.ndarray:
+    """
+    Cột weight của weather (weights_array_for) đã áp policy của query, tính trên bản copy ndarray:
+    - penalty_map: nhân multiplier (vùng ngập) - key (from, to) đổi sang edge_idx 1 lần (edge_ids_of)
+    - blocked_edges / edge đi vào blocked_nodes: inf → không bao giờ được relax
+    Vòng lặp A* chỉ còn đọc weights[edge_idx], không tạo tuple/hash probe mỗi neighbor
+    """
+    node_index = graph.node_index
+    edge_ids = graph.edge_ids_of
+    policy = graph.weights_array_for(weather).copy()
+    
+    penalty_idx: List[int] = []
+    penalty_val: List[float] = []
+    for (from_id, to_id), multiplier in penalty_map.items():
+        for edge_idx in edge_ids(from_id, to_id):
+            penalty_idx.append(edge_idx)
+            penalty_val.append(multiplier)
+    if penalty_idx:
+        policy[penalty_idx] *= penalty_val
+    
+    blocked_idx = [edge_idx for from_id, to_id in blocked_edges for edge_idx in edge_ids(from_id, to_id)]
+    if blocked_idx:
+        policy[blocked_idx] = np.inf
+    
+    # Nút giao bị phong tỏa: chặn mọi edge đi vào node (csr_indices = node đích của edge)
+    if blocked_nodes:
+        blocked_node_idx = [node_index[node_id] for node_id in blocked_nodes if node_id in node_index]
+        policy[np.isin(graph.csr_indices, blocked_node_idx)] = np.inf
+    
+    return policy
 
 
 def bidirectional_astar(
@@ -465,27 +815,232 @@ def bidirectional_astar(
     blocked_nodes: Set[int] = None
 ) -> PathResult:
     """
-    [DEPRECATED] Bidirectional A* - Đã thay thế bằng astar_search
+    Bidirectional A* - 2 hướng tìm kiếm xen kẽ (từ start trên adjacency, từ end trên reverse adjacency)
     
-    Hàm này có vấn đề khi merge geometries từ 2 hướng, có thể gây "đường chéo".
-    Sử dụng astar_search thay thế - one-directional A* với geometry được xây dựng trực tiếp.
+    Potential cân bằng p(v) = (h_end(v) - h_start(v)) / 2 cho hướng thuận, -p(v) cho hướng ngược
+    → dừng đúng khi top_fwd + top_bwd >= mu (mu = đường tốt nhất đã gặp qua một node chung)
+    
+    Geometry dựng trực tiếp từ came_from_edge của 2 nửa (mọi edge đều đi thuận chiều
+    from_node → to_node), không merge/đoán chiều như bản cũ
     
     Args:
         graph: LightGraph (immutable - không modify)
         start_id, end_id: Node IDs
         weather: Điều kiện thời tiết
-        penalty_map: Dict[(from, to)] -> multiplier cho flood areas (O(1) lookup)
+        penalty_map: Dict[(from, to)] -> multiplier cho flood areas
         blocked_edges: Set[(from, to)] - edges bị chặn hoàn toàn
+        blocked_nodes: Set[int] - nodes bị chặn (ngã 3, ngã 4)
+    """
+    start_time = time.perf_counter()
     
-    Performance:
-        - Không copy graph
-        - Penalty lookup: O(1) với hash map
-        - Blocked check: O(1) với set
+    if not graph.has_node(start_id) or not graph.has_node(end_id):
+        return PathResult(success=False, error="Start hoặc end node không tồn tại")
+    if blocked_nodes:
+        if start_id in blocked_nodes:
+            return PathResult(success=False, error="Điểm bắt đầu nằm trong vùng cấm")
+        if end_id in blocked_nodes:
+            return PathResult(success=False, error="Điểm kết thúc nằm trong vùng cấm")
+    
+    if graph.adjacency_by_idx is None:
+        graph.build_node_index()
+    n = len(graph.node_index)
+    start_idx = graph.node_index[start_id]
+    end_idx = graph.node_index[end_id]
+    
+    weights = graph.weights_for(weather)
+    if penalty_map or blocked_edges or blocked_nodes:
+        weights = _policy_weights(graph, weather, penalty_map or {}, blocked_edges or set(), blocked_nodes or set()).tolist()
     
-    Note: Hàm này redirect về astar_search để tương thích ngược
+    adjacency = graph.adjacency_by_idx
+    reverse_adjacency = graph.reverse_adjacency_by_idx
+    
+    inf = math.inf
+    heappush, heappop = heapq.heappush, heapq.heappop
+    
+    # Potential hướng thuận p(v) cho mọi node, tính vectorized 1 lần (hướng ngược dùng -p(v)).
+    # h_end ≤ d(v, end), h_start ≤ d(start, v): equirectangular + ALT như astar_search
+    use_alt = not penalty_map or min(penalty_map.values()) >= 1.0
+    h_end = _heuristic_array(graph, end_idx, weather, use_alt)
+    h_start = _heuristic_array(graph, start_idx, weather, use_alt, reverse=True)
+    potential = ((h_end - h_start) * 0.5).tolist()
+    
+    g_fwd, g_bwd = [inf] * n, [inf] * n
+    closed_fwd, closed_bwd = bytearray(n), bytearray(n)
+    # Hướng thuận: came_from = node trước; hướng ngược: came_from = node kế tiếp (về phía end)
+    came_from_fwd, came_from_bwd = [-1] * n, [-1] * n
+    edge_fwd, edge_bwd = [-1] * n, [-1] * n
+    
+    g_fwd[start_idx] = 0.0
+    g_bwd[end_idx] = 0.0
+    # Heap entry (key, idx) - hòa key thì so idx, không cần counter
+    open_fwd = [(potential[start_idx], start_idx)]
+    open_bwd = [(-potential[end_idx], end_idx)]
+    
+    # mu: chi phí đường tốt nhất đã gặp (qua node chung meet)
+    mu, meet = (0.0, start_idx) if start_idx == end_idx else (inf, -1)
+    nodes_visited = 0
+    
+    while open_fwd and open_bwd:
+        # Bỏ entry stale ở đỉnh 2 heap (lazy decrease-key) trước khi so điều kiện dừng
+        while open_fwd and closed_fwd[open_fwd[0][1]]:
+            heappop(open_fwd)
+        while open_bwd and closed_bwd[open_bwd[0][1]]:
+            heappop(open_bwd)
+        if not open_fwd or not open_bwd:
+            break
+        # Điều kiện dừng đúng với potential cân bằng (p_bwd = -p_fwd): trên graph reduced
+        # l'(v,w) = l(v,w) - p(v) + p(w) ≥ 0 (h consistent), 2 hướng là Dijkstra với
+        # key' = key - p(start) (thuận), key + p(end) (ngược), mu' = mu - p(start) + p(end)
+        # → top'_fwd + top'_bwd ≥ mu'  ⇔  top_fwd + top_bwd ≥ mu (hằng số triệt tiêu)
+        if open_fwd[0][0] + open_bwd[0][0] >= mu:
+            break
+        
+        # Mở rộng hướng có key nhỏ hơn
+        if open_fwd[0][0] <= open_bwd[0][0]:
+            _, current = heappop(open_fwd)
+            closed_fwd[current] = 1
+            nodes_visited += 1
+            current_g = g_fwd[current]
+            for neighbor, _, edge_idx in adjacency[current]:
+                if closed_fwd[neighbor]:
+                    continue
+                tentative_g = current_g + weights[edge_idx]
+                if tentative_g < g_fwd[neighbor]:
+                    g_fwd[neighbor] = tentative_g
+                    came_from_fwd[neighbor] = current
+                    edge_fwd[neighbor] = edge_idx
+                    heappush(open_fwd, (tentative_g + potential[neighbor], neighbor))
+                    total = tentative_g + g_bwd[neighbor]
+                    if total < mu:
+                        mu, meet = total, neighbor
+        else:
+            _, current = heappop(open_bwd)
+            closed_bwd[current] = 1
+            nodes_visited += 1
+            current_g = g_bwd[current]
+            for neighbor, _, edge_idx in reverse_adjacency[current]:
+                if closed_bwd[neighbor]:
+                    continue
+                tentative_g = current_g + weights[edge_idx]
+                if tentative_g < g_bwd[neighbor]:
+                    g_bwd[neighbor] = tentative_g
+                    came_from_bwd[neighbor] = current
+                    edge_bwd[neighbor] = edge_idx
+                    heappush(open_bwd, (tentative_g - potential[neighbor], neighbor))
+                    total = tentative_g + g_fwd[neighbor]
+                    if total < mu:
+                        mu, meet = total, neighbor
+    
+    if meet < 0:
+        elapsed = time.perf_counter() - start_time
+        return PathResult(
+            success=False,
+            error="Không tìm thấy đường đi",
+            stats={"nodes_visited": nodes_visited, "search_time_ms": elapsed * 1000}
+        )
+    
+    # Nửa đầu: meet → start theo came_from_fwd (đảo lại), nửa sau: meet → end theo came_from_bwd
+    path_idx = deque([meet])
+    edge_ids = deque()
+    node = meet
+    while node != start_idx:
+        edge_ids.appendleft(edge_fwd[node])
+        node = came_from_fwd[node]
+        path_idx.appendleft(node)
+    node = meet
+    while node != end_idx:
+        edge_ids.append(edge_bwd[node])
+        node = came_from_bwd[node]
+        path_idx.append(node)
+    
+    nodes_by_idx, edges_by_idx = graph.nodes_by_idx, graph.edges_by_idx
+    path_edges = [edges_by_idx[e] for e in edge_ids]
+    segments = []
+    for (u, v), edge in zip(zip(path_idx, list(path_idx)[1:]), path_edges):
+        if len(edge.geometry) >= 2:
+            segments.append(edge.forward_geometry)
+        else:
+            a, b = nodes_by_idx[u], nodes_by_idx[v]
+            segments.append([(a.lon, a.lat), (b.lon, b.lat)])
+    
+    path = [nodes_by_idx[i].id for i in path_idx]
+    elapsed = time.perf_counter() - start_time
+    return PathResult(
+        success=True,
+        path=path,
+        distance=sum(e.length for e in path_edges),
+        duration=sum(e.travel_time for e in path_edges),
+        geometry=_concat_segments(segments),
+        stats={
+            "nodes_visited": nodes_visited,
+            "search_time_ms": elapsed * 1000,
+            "path_length": len(path),
+            "algorithm": "bidirectional_astar",
+            "weather": weather
+        }
+    )
+
+
+# ======================================================================
+# Graph cache (1 lần / process)
+# ======================================================================
+
+# Graph đã build được pickle cạnh cache Overpass; đổi version khi pipeline build thay đổi
+GRAPH_CACHE_DIR = CACHE_DIR.parent / "graph"
+GRAPH_CACHE_VERSION = 14
+
+_GRAPH_CACHE: Dict[Tuple[float, float, float, float], Tuple[OSMData, LightGraph]] = {}
+
+
+def _load_graph_cached(bbox: Tuple[float, float, float, float]) -> Tuple[Optional[OSMData], Optional[LightGraph]]:
+    """
+    Fetch + build graph cho BBOX, cache theo process.
+    Graph chỉ đọc sau khi build (block/penalty truyền qua set/dict riêng)
+    nên các service dùng chung một instance, không phải chạy lại pipeline.
+    Graph được pickle xuống đĩa nên process sau chỉ cần unpickle.
+    Lỗi fetch không được cache để lần sau còn thử lại.
+    """
+    cached = _GRAPH_CACHE.get(bbox)
+    if cached is not None:
+        return cached
+    osm_data = fetch_from_overpass(bbox, True)
+    if not osm_data:
+        return None, None
+    
+    graph_file = GRAPH_CACHE_DIR / f"{_get_cache_key(bbox)}.v{GRAPH_CACHE_VERSION}.pkl"
+    graph = load_graph(graph_file)
+    if graph is None:
+        graph = build_graph_from_osm(osm_data)
+        if graph.nodes:
+            save_graph(graph, graph_file)
+    
+    cached = _GRAPH_CACHE[bbox] = (osm_data, graph)
+    return cached
+
+
+# ======================================================================
+# Blocking geometry cache
+# ======================================================================
+
+# Số GeoJSON geometry khác nhau giữ shapely object (vùng ngập đang hoạt động được gửi lại mỗi request)
+SHAPE_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def _shape_cached(geom_key: bytes, radius_deg: Optional[float] = None):
     """
-    # Redirect to optimized one-directional A*
-    return astar_search(graph, start_id, end_id, weather, penalty_map, blocked_edges, blocked_nodes)
+    GeoJSON geometry (orjson.dumps bytes) → shapely geometry đã prepare
+    - radius_deg: Circle (Point + radius) → buffer quanh điểm
+    Geometry shapely là immutable nên dùng chung giữa các request/thread;
+    prepare sẵn để STRtree.query(predicate) và intersects_xy không phải prepare lại
+    """
+    geom_data = orjson.loads(geom_key)
+    if radius_deg is not None:
+        geom_shape = Point(geom_data["coordinates"]).buffer(radius_deg)
+    else:
+        geom_shape = shape(geom_data)
+    shapely.prepare(geom_shape)
+    return geom_shape
 
 
 # ======================================================================
@@ -504,15 +1059,24 @@ class FastRoutingService:
     
     def load_from_bbox(self, bbox: Tuple[float, float, float, float], use_cache: bool = True) -> bool:
         """Load graph từ BBOX và khởi tạo local geocoding"""
-        osm_data = fetch_from_overpass(bbox, use_cache)
+        if use_cache:
+            osm_data, graph = _load_graph_cached(tuple(bbox))
+        else:
+            osm_data = fetch_from_overpass(bbox, use_cache)
+            graph = build_graph_from_osm(osm_data) if osm_data else None
         if osm_data:
             self.osm_data = osm_data
-            self.graph = build_graph_from_osm(osm_data)
+            self.graph = graph
             
             # Khởi tạo local geocoding với OSM data
             if self.graph:
-                graph_node_ids = set(self.graph.nodes.keys())
-                self.geocoding_db = init_local_geocoding(osm_data, graph_node_ids)
+                # DB FTS5 lưu cạnh graph cache (cùng key/version) → khởi động sau chỉ copy vào memory
+                geocoding_file = (
+                    GRAPH_CACHE_DIR / f"{_get_cache_key(tuple(bbox))}.v{GRAPH_CACHE_VERSION}.geocoding.db"
+                    if use_cache else None
+                )
+                # keys view: `in` O(1) + duyệt được, không copy O(N) ra set mới
+                self.geocoding_db = init_local_geocoding(osm_data, self.graph.nodes.keys(), geocoding_file)
             
             return True
         return False
@@ -524,7 +1088,9 @@ class FastRoutingService:
         Returns:
             List[Dict] với keys: node_id, lat, lon, address, score, address_type
         """
-        if not self.geocoding_db:
+        # Query 1 ký tự (sau strip) không đáng quét index FTS5
+        query = query.strip()
+        if not self.geocoding_db or len(query) < 2:
             return []
         
         results = self.geocoding_db.search(query, limit)
@@ -549,6 +1115,10 @@ class FastRoutingService:
     def find_nearest_node(self, lat: float, lon: float) -> Optional[int]:
         return self.graph.find_nearest_node(lat, lon) if self.graph else None
     
+    def find_nearest_nodes_batch(self, coords: np.ndarray) -> Optional[np.ndarray]:
+        """Snap nhiều điểm [lat, lon] cùng lúc - một query KD-Tree duy nhất"""
+        return self.graph.find_nearest_nodes(coords) if self.graph else None
+    
     def find_route(
         self,
         start_lat: float,
@@ -567,8 +1137,9 @@ class FastRoutingService:
         if weather_condition not in C_CONTEXT:
             weather_condition = "normal"
         
-        start_id = self.find_nearest_node(start_lat, start_lon)
-        end_id = self.find_nearest_node(end_lat, end_lon)
+        # Snap 2 điểm trong 1 lần query KD-Tree
+        node_ids = self.find_nearest_nodes_batch(np.array([[start_lat, start_lon], [end_lat, end_lon]]))
+        start_id, end_id = node_ids.tolist() if node_ids is not None else (None, None)
         
         if start_id is None:
             return {"error": "Không tìm thấy node gần điểm bắt đầu"}
@@ -607,6 +1178,29 @@ class FastRoutingService:
         
         return self._execute_routing(start_node_id, end_node_id, weather_condition, blocked_edges, weight_multipliers, blocked_nodes)
     
+    def matrix(
+        self,
+        source_ids: Sequence[int],
+        target_ids: Sequence[int],
+        weather_condition: str = "normal"
+    ) -> Optional[np.ndarray]:
+        """Ma trận chi phí N×M giữa các node (xem cost_matrix), None nếu graph chưa load"""
+        if not self.graph:
+            return None
+        if weather_condition not in C_CONTEXT:
+            weather_condition = "normal"
+        return cost_matrix(self.graph, source_ids, target_ids, weather_condition)
+    
+    def find_routes_many_to_one(
+        self,
+        source_ids: Sequence[int],
+        target_id: int,
+        weather_condition: str = "normal"
+    ) -> Optional[np.ndarray]:
+        """Chi phí từ mỗi node nguồn tới 1 đích - 1 lần Dijkstra trên graph đảo chiều"""
+        costs = self.matrix(source_ids, [target_id], weather_condition)
+        return costs[:, 0] if costs is not None else None
+    
     def _execute_routing(
         self,
         start_id: int,
@@ -619,20 +1213,27 @@ class FastRoutingService:
         """
         Core routing logic với Weight Overlay
         
-        KHÔNG copy graph - truyền penalty_map trực tiếp vào A*
+        KHÔNG copy graph - truyền penalty_map trực tiếp vào A*; query không có policy chạy trên CH
         """
-        result = astar_search(
-            self.graph, 
-            start_id, 
-            end_id, 
-            weather_condition,
-            penalty_map=penalty_map,
-            blocked_edges=blocked_edges,
-            blocked_nodes=blocked_nodes
-        )
+        # Không có vùng ngập/chặn: weight đúng bằng lúc tiền xử lý → query trên CH
+        result = None
+        if not (penalty_map or blocked_edges or blocked_nodes):
+            result = _ch_run(self.graph, start_id, end_id, weather_condition)
+        
+        # Gọi thẳng _astar_run: dựng dict response từ AstarOutcome, không qua PathResult
+        if result is None:
+            result = _astar_run(
+                self.graph, 
+                start_id, 
+                end_id, 
+                weather_condition,
+                penalty_map=penalty_map,
+                blocked_edges=blocked_edges,
+                blocked_nodes=blocked_nodes
+            )
         
         if not result.success:
-            return {"error": result.error, "stats": result.stats}
+            return {"error": result.error, "stats": _outcome_stats(result, weather_condition)}
         
         # Return dict structure tối ưu cho ORJSON
         return {
@@ -647,7 +1248,7 @@ class FastRoutingService:
                 }
             },
             "path": result.path,
-            "stats": result.stats
+            "stats": _outcome_stats(result, weather_condition)
         }
     
     def find_affected_edges_fast(
@@ -683,6 +1284,9 @@ class FastRoutingService:
         if self.graph._strtree is None:
             self.graph.build_strtree()
         
+        # Bước 1: parse GeoJSON → shapely (lỗi từng geometry chỉ bỏ qua geometry đó)
+        shapes = []
+        shape_props: List[Tuple[str, Optional[float]]] = []
         for geom_dict in geometries:
             try:
                 geom_data = geom_dict.get("geometry", geom_dict)
@@ -692,70 +1296,68 @@ class FastRoutingService:
                 geom_type = geom_data.get("type", "")
                 if geom_type == "Point" and "radius" in props:
                     # Circle: convert Point + radius thành buffer (circle)
-                    from shapely.geometry import Point
-                    import math
-                    
-                    center = Point(geom_data["coordinates"])
                     radius_meters = props.get("radius", 0)
                     if radius_meters > 0:
                         # Convert radius từ meters sang degrees
                         # 1 degree lat ≈ 111320 meters
-                        # 1 degree lon ≈ 111320 * cos(lat) meters
-                        lat = geom_data["coordinates"][1]
                         radius_deg = radius_meters / 111320  # Dùng radius trung bình
                         
                         # Tạo buffer (circle) từ point - STRtree sẽ query với circle này
-                        geom_shape = center.buffer(radius_deg)
+                        geom_shape = _shape_cached(orjson.dumps(geom_data), radius_deg)
                     else:
                         continue
                 else:
                     # Polygon hoặc các geometry khác - xử lý giống nhau
-                    geom_shape = shape(geom_data)
+                    geom_shape = _shape_cached(orjson.dumps(geom_data))
                 
                 block_type = props.get("blockType", "block")
                 
                 # Lấy penalty multiplier từ properties (default: 15.0 cho flood - tăng để route thay đổi rõ ràng)
                 penalty = props.get("penalty", 15.0 if block_type == "flood" else None)
                 
-                # STRtree query - O(log N) - hoạt động với cả Polygon và Circle (buffer)
-                affected_edges = self.graph.query_edges_in_geometry(geom_shape)
-                
-                # Block intersections (ngã 3, ngã 4) nếu được yêu cầu
-                if block_intersections:
-                    intersections = self.graph.query_nodes_in_geometry(geom_shape, min_degree=min_intersection_degree)
-                    blocked_nodes.update(intersections)
-                
-                for edge_key in affected_edges:
-                    # Block cả 2 chiều để đảm bảo HARD BLOCK
-                    reverse_key = (edge_key[1], edge_key[0])
-                    
-                    if block_type == "flood" and penalty is not None:
-                        # Flood area: tăng weight rất cao để né hoàn toàn
-                        # Nếu penalty >= 100, coi như block (tránh đi xuyên qua)
-                        if penalty >= 100.0:
-                            blocked.add(edge_key)
-                            blocked.add(reverse_key)  # Block cả 2 chiều
-                            # Xóa khỏi penalty_map nếu có
-                            penalty_map.pop(edge_key, None)
-                            penalty_map.pop(reverse_key, None)
-                        else:
-                            # Tăng weight, nếu đã có penalty, lấy max
-                            current_penalty = penalty_map.get(edge_key, 1.0)
-                            penalty_map[edge_key] = max(current_penalty, penalty)
-                            # Áp dụng penalty cho cả 2 chiều
-                            current_penalty_rev = penalty_map.get(reverse_key, 1.0)
-                            penalty_map[reverse_key] = max(current_penalty_rev, penalty)
-                    else:
-                        # Block hoàn toàn - HARD BLOCK cả 2 chiều
-                        blocked.add(edge_key)
-                        blocked.add(reverse_key)
-                        
+                shapes.append(geom_shape)
+                shape_props.append((block_type, penalty))
             except Exception as e:
                 import traceback
                 print(f"Error processing geometry: {e}")
                 traceback.print_exc()
                 continue
         
+        # Bước 2: 1 lần STRtree.query(predicate="intersects") cho mọi geometry (vectorized)
+        affected_by_shape = self.graph.query_edges_in_geometries(shapes)
+        
+        # Bước 3: áp block/penalty theo đúng thứ tự geometry gửi lên
+        for geom_shape, (block_type, penalty), affected_edges in zip(shapes, shape_props, affected_by_shape):
+            # Block intersections (ngã 3, ngã 4) nếu được yêu cầu
+            if block_intersections:
+                intersections = self.graph.query_nodes_in_geometry(geom_shape, min_degree=min_intersection_degree)
+                blocked_nodes.update(intersections)
+            
+            for edge_key in affected_edges:
+                # Block cả 2 chiều để đảm bảo HARD BLOCK
+                reverse_key = (edge_key[1], edge_key[0])
+                
+                if block_type == "flood" and penalty is not None:
+                    # Flood area: tăng weight rất cao để né hoàn toàn
+                    # Nếu penalty >= 100, coi như block (tránh đi xuyên qua)
+                    if penalty >= 100.0:
+                        blocked.add(edge_key)
+                        blocked.add(reverse_key)  # Block cả 2 chiều
+                        # Xóa khỏi penalty_map nếu có
+                        penalty_map.pop(edge_key, None)
+                        penalty_map.pop(reverse_key, None)
+                    else:
+                        # Tăng weight, nếu đã có penalty, lấy max
+                        current_penalty = penalty_map.get(edge_key, 1.0)
+                        penalty_map[edge_key] = max(current_penalty, penalty)
+                        # Áp dụng penalty cho cả 2 chiều
+                        current_penalty_rev = penalty_map.get(reverse_key, 1.0)
+                        penalty_map[reverse_key] = max(current_penalty_rev, penalty)
+                else:
+                    # Block hoàn toàn - HARD BLOCK cả 2 chiều
+                    blocked.add(edge_key)
+                    blocked.add(reverse_key)
+        
         return blocked, penalty_map, blocked_nodes
     
     # Legacy method - redirect to fast version
@@ -804,29 +1406,21 @@ class FastRoutingService:
         # Buffer tolerance: 10^-6 độ để bắt dính sai số làm tròn
         BUFFER_TOLERANCE = 1e-6
         
-        for forbidden_line in forbidden_lines:
-            if forbidden_line is None or forbidden_line.is_empty:
-                continue
-            
-            # Áp dụng buffer cực nhỏ cho forbidden line
-            # Điều này đảm bảo bắt dính các trường hợp tọa độ bị lệch do sai số làm tròn
-            buffered_line = forbidden_line.buffer(BUFFER_TOLERANCE)
-            
-            # STRtree query - O(log N) - trả về indices của edges có bounding box intersect
-            candidate_indices = self.graph._strtree.query(buffered_line)
-            
-            # Kiểm tra giao cắt chính xác với geometry thực tế của edge
-            for idx in candidate_indices:
-                # Lấy LineString geometry thực tế của edge từ STRtree
-                edge_line = self.graph._edge_geometries[idx]
-                edge_key = self.graph._edge_keys[idx]
-                
-                # Kiểm tra giao cắt chính xác (STRtree chỉ check bounding box)
-                # Sử dụng geometry thực tế của edge để đảm bảo chính xác
-                if edge_line.intersects(buffered_line):
-                    # Block cả 2 chiều để đảm bảo HARD BLOCK
-                    blocked_edges.add(edge_key)
-                    blocked_edges.add((edge_key[1], edge_key[0]))
+        # Áp dụng buffer cực nhỏ cho forbidden line
+        # Điều này đảm bảo bắt dính các trường hợp tọa độ bị lệch do sai số làm tròn
+        buffered_lines = [
+            forbidden_line.buffer(BUFFER_TOLERANCE)
+            for forbidden_line in forbidden_lines
+            if forbidden_line is not None and not forbidden_line.is_empty
+        ]
+        
+        # 1 lần STRtree.query(predicate="intersects") cho mọi rào chắn:
+        # lọc bbox + giao cắt chính xác với geometry thực tế của edge
+        for affected_edges in self.graph.query_edges_in_geometries(buffered_lines):
+            for edge_key in affected_edges:
+                # Block cả 2 chiều để đảm bảo HARD BLOCK
+                blocked_edges.add(edge_key)
+                blocked_edges.add((edge_key[1], edge_key[0]))
         
         return blocked_edges
     
@@ -5,70 +5,121 @@ Schema:
   id INTEGER PRIMARY KEY AUTOINCREMENT
   name TEXT
   type TEXT ('polygon' | 'circle' | 'multipolygon')
-  geometry TEXT (GeoJSON string)
+  geometry TEXT (GeoJSON string - trả nguyên cho API/FE)
+  geometry_wkb BLOB (WKB của geometry - đường đọc phía server: STRtree, giao cắt)
   severity REAL (penalty multiplier, ví dụ 5.0)
   is_active INTEGER (0/1)
   updated_at TEXT (ISO timestamp)
 """
-import json
+import orjson
 import sqlite3
+import threading
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from datetime import datetime
 
+import numpy as np
+import shapely
+from shapely import STRtree, box
+
 
 DEFAULT_DB_PATH = Path(__file__).parent / "cache" / "flood_zones.db"
 DEFAULT_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
+# 1 connection dùng chung / file DB (mở + tạo bảng 1 lần, giữ page cache giữa các request)
+# thay vì connect/init_db mỗi lần gọi; RLock tuần tự hóa truy cập từ threadpool của FastAPI
+_CONNS: Dict[Path, sqlite3.Connection] = {}
+_LOCK = threading.RLock()
+
+# Cột trả ra API (không kèm geometry_wkb - bytes chỉ dùng nội bộ)
+_ZONE_COLUMNS = "id, name, type, geometry, severity, is_active, updated_at"
+
+# STRtree các zone active theo db_path: (token, tree, rows) - token = (COUNT, MAX(updated_at), MAX(id))
+# của cả bảng, đổi khi có ghi (kể cả từ worker process khác) → dựng lại lười ở lần query sau
+_zone_tree_cache: Dict[Path, Tuple[tuple, Optional[STRtree], List[Dict]]] = {}
+
 
 def _get_conn(db_path: Path = DEFAULT_DB_PATH) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    """Connection dùng chung cho db_path - gọi trong `with _LOCK`"""
+    conn = _CONNS.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # WAL: đọc không chặn ghi; synchronous=NORMAL đủ an toàn với WAL; temp/cache trong RAM (64MB)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-64000")
+        _create_table(conn)
+        _CONNS[db_path] = conn
     return conn
 
 
-def init_db(db_path: Path = DEFAULT_DB_PATH):
-    """Tạo bảng nếu chưa có"""
-    with _get_conn(db_path) as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS flood_zones (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                type TEXT NOT NULL,
-                geometry TEXT NOT NULL,
-                severity REAL DEFAULT 5.0,
-                is_active INTEGER DEFAULT 1,
-                updated_at TEXT DEFAULT (datetime('now'))
-            )
-            """
+def _create_table(conn: sqlite3.Connection):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS flood_zones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            geometry TEXT NOT NULL,
+            severity REAL DEFAULT 5.0,
+            is_active INTEGER DEFAULT 1,
+            updated_at TEXT DEFAULT (datetime('now')),
+            geometry_wkb BLOB
         )
-        conn.commit()
+        """
+    )
+    # Migration DB cũ (chỉ có cột GeoJSON TEXT): thêm cột WKB rồi điền từ geometry sẵn có
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(flood_zones)")}
+    if "geometry_wkb" not in columns:
+        conn.execute("ALTER TABLE flood_zones ADD COLUMN geometry_wkb BLOB")
+    missing = conn.execute("SELECT id, geometry FROM flood_zones WHERE geometry_wkb IS NULL").fetchall()
+    if missing:
+        wkbs = _to_wkb([row[1] for row in missing])
+        conn.executemany(
+            "UPDATE flood_zones SET geometry_wkb = ? WHERE id = ?",
+            [(wkb, row[0]) for wkb, row in zip(wkbs, missing) if wkb is not None],
+        )
+    conn.commit()
+
+
+def _to_wkb(geojson_texts: List[str]) -> List[Optional[bytes]]:
+    """GeoJSON string → WKB (vectorized), geometry lỗi → None (cột để NULL, zone bị bỏ qua khi dựng STRtree)"""
+    geoms = shapely.from_geojson(geojson_texts, on_invalid="ignore")
+    return [None if wkb is None else bytes(wkb) for wkb in shapely.to_wkb(geoms).tolist()]
+
+
+def init_db(db_path: Path = DEFAULT_DB_PATH):
+    """Tạo bảng nếu chưa có (chạy 1 lần khi mở connection dùng chung)"""
+    with _LOCK:
+        _get_conn(db_path)
 
 
 def list_zones(include_inactive: bool = True, db_path: Path = DEFAULT_DB_PATH) -> List[Dict]:
-    init_db(db_path)
-    query = "SELECT * FROM flood_zones"
+    query = f"SELECT {_ZONE_COLUMNS} FROM flood_zones"
     params = ()
     if not include_inactive:
         query += " WHERE is_active = 1"
-    with _get_conn(db_path) as conn:
-        rows = conn.execute(query, params).fetchall()
-        return [dict(row) for row in rows]
+    with _LOCK:
+        rows = _get_conn(db_path).execute(query, params).fetchall()
+    return [dict(row) for row in rows]
 
 
 def create_zone(data: Dict, db_path: Path = DEFAULT_DB_PATH) -> int:
-    init_db(db_path)
-    with _get_conn(db_path) as conn:
+    with _LOCK:
+        conn = _get_conn(db_path)
+        geometry = orjson.dumps(data["geometry"]).decode()
         cur = conn.execute(
             """
-            INSERT INTO flood_zones (name, type, geometry, severity, is_active, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT INTO flood_zones (name, type, geometry, geometry_wkb, severity, is_active, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 data["name"],
                 data.get("type", "polygon"),
-                json.dumps(data["geometry"]),
+                geometry,
+                _to_wkb([geometry])[0],
                 float(data.get("severity", 5.0)),
                 1 if data.get("is_active", True) else 0,
                 datetime.utcnow().isoformat(),
@@ -78,15 +129,48 @@ def create_zone(data: Dict, db_path: Path = DEFAULT_DB_PATH) -> int:
         return cur.lastrowid
 
 
+def create_zones(items: List[Dict], db_path: Path = DEFAULT_DB_PATH) -> int:
+    """Thêm nhiều zone (admin import) bằng 1 executemany trong 1 transaction - trả số zone đã thêm"""
+    if not items:
+        return 0
+    now = datetime.utcnow().isoformat()
+    geometries = [orjson.dumps(data["geometry"]).decode() for data in items]
+    rows = [
+        (
+            data["name"],
+            data.get("type", "polygon"),
+            geometry,
+            wkb,
+            float(data.get("severity", 5.0)),
+            1 if data.get("is_active", True) else 0,
+            now,
+        )
+        for data, geometry, wkb in zip(items, geometries, _to_wkb(geometries))
+    ]
+    with _LOCK:
+        conn = _get_conn(db_path)
+        with conn:  # commit 1 lần, lỗi thì rollback cả lô
+            conn.executemany(
+                """
+                INSERT INTO flood_zones (name, type, geometry, geometry_wkb, severity, is_active, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+    return len(rows)
+
+
 def update_zone(zone_id: int, data: Dict, db_path: Path = DEFAULT_DB_PATH) -> bool:
-    init_db(db_path)
     fields = []
     values = []
     for key in ("name", "type", "geometry", "severity", "is_active"):
         if key in data:
             fields.append(f"{key} = ?")
             if key == "geometry":
-                values.append(json.dumps(data[key]))
+                geometry = orjson.dumps(data[key]).decode()
+                values.append(geometry)
+                fields.append("geometry_wkb = ?")
+                values.append(_to_wkb([geometry])[0])
             elif key == "is_active":
                 values.append(1 if data[key] else 0)
             else:
@@ -96,7 +180,8 @@ def update_zone(zone_id: int, data: Dict, db_path: Path = DEFAULT_DB_PATH) -> bo
     values.append(datetime.utcnow().isoformat())
     values.append(zone_id)
     set_clause = ", ".join(fields + ["updated_at = ?"])
-    with _get_conn(db_path) as conn:
+    with _LOCK:
+        conn = _get_conn(db_path)
         cur = conn.execute(
             f"UPDATE flood_zones SET {set_clause} WHERE id = ?",
             tuple(values),
@@ -106,8 +191,8 @@ def update_zone(zone_id: int, data: Dict, db_path: Path = DEFAULT_DB_PATH) -> bo
 
 
 def delete_zone(zone_id: int, db_path: Path = DEFAULT_DB_PATH) -> bool:
-    init_db(db_path)
-    with _get_conn(db_path) as conn:
+    with _LOCK:
+        conn = _get_conn(db_path)
         cur = conn.execute("DELETE FROM flood_zones WHERE id = ?", (zone_id,))
         conn.commit()
         return cur.rowcount > 0
@@ -117,27 +202,69 @@ def get_active_zones(db_path: Path = DEFAULT_DB_PATH) -> List[Dict]:
     return list_zones(include_inactive=False, db_path=db_path)
 
 
-def to_geojson_features(rows: List[Dict]) -> List[Dict]:
-    """Convert rows to GeoJSON features with blockType=flood and penalty=severity"""
-    features = []
+def _active_zone_tree(db_path: Path = DEFAULT_DB_PATH) -> Tuple[Optional[STRtree], List[Dict]]:
+    """STRtree (geometry shapely) của các zone active, chỉ dựng lại khi bảng thay đổi"""
+    with _LOCK:
+        conn = _get_conn(db_path)
+        token = tuple(conn.execute(
+            "SELECT COUNT(*), MAX(updated_at), MAX(id) FROM flood_zones"
+        ).fetchone())
+        cached = _zone_tree_cache.get(db_path)
+        if cached is not None and cached[0] == token:
+            return cached[1], cached[2]
+        
+        rows = conn.execute(
+            f"SELECT {_ZONE_COLUMNS}, geometry_wkb FROM flood_zones WHERE is_active = 1 AND geometry_wkb IS NOT NULL"
+        ).fetchall()
+        # WKB → shapely 1 lần gọi C cho mọi zone (không parse JSON); WKB lỗi → None, bỏ qua zone đó
+        geoms = shapely.from_wkb([row["geometry_wkb"] for row in rows], on_invalid="ignore") if rows else []
+        keep = [i for i, geom in enumerate(geoms) if geom is not None]
+        columns = _ZONE_COLUMNS.split(", ")
+        rows = [{key: rows[i][key] for key in columns} for i in keep]
+        tree = STRtree(np.asarray(geoms, dtype=object)[keep]) if keep else None
+        _zone_tree_cache[db_path] = (token, tree, rows)
+        return tree, rows
+
+
+def query_zones_for_bbox(
+    min_lon: float, min_lat: float, max_lon: float, max_lat: float,
+    db_path: Path = DEFAULT_DB_PATH
+) -> List[Dict]:
+    """Các zone active giao với bbox - O(log N) qua STRtree thay vì duyệt mọi zone"""
+    tree, rows = _active_zone_tree(db_path)
+    if tree is None:
+        return []
+    hits = tree.query(box(min_lon, min_lat, max_lon, max_lat), predicate="intersects")
+    return [rows[i] for i in np.sort(hits).tolist()]
+
+
+def _iter_zone_features(rows: Iterable[Dict]) -> Iterator[Dict]:
+    """Feature cho từng zone, blockType=flood và penalty=severity (bỏ qua zone có geometry lỗi)"""
     for row in rows:
         geom = row.get("geometry")
         try:
-            geom_obj = json.loads(geom) if isinstance(geom, str) else geom
+            geom_obj = orjson.loads(geom) if isinstance(geom, str) else geom
         except Exception:
             continue
-        features.append(
-            {
-                "type": "Feature",
-                "properties": {
-                    "blockType": "flood",
-                    "penalty": float(row.get("severity", 5.0)),
-                    "id": row.get("id"),
-                    "name": row.get("name"),
-                    "is_active": bool(row.get("is_active")),
-                },
-                "geometry": geom_obj,
-            }
-        )
-    return features
+        yield {
+            "type": "Feature",
+            "properties": {
+                "blockType": "flood",
+                "penalty": float(row.get("severity", 5.0)),
+                "id": row.get("id"),
+                "name": row.get("name"),
+                "is_active": bool(row.get("is_active")),
+            },
+            "geometry": geom_obj,
+        }
+
+
+def to_geojson_features(rows: List[Dict]) -> List[Dict]:
+    """Convert rows to GeoJSON features with blockType=flood and penalty=severity"""
+    return list(_iter_zone_features(rows))
+
 
+def iter_geojson_features(rows: Iterable[Dict]) -> Iterator[bytes]:
+    """Như to_geojson_features nhưng trả từng feature đã orjson-encode (stream, không dựng list)"""
+    for feature in _iter_zone_features(rows):
+        yield orjson.dumps(feature)
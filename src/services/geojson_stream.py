@@ -0,0 +1,32 @@
+# src/services/geojson_stream.py
+"""
+Stream GeoJSON FeatureCollection cho StreamingResponse
+- Nhận feature đã orjson-encode (graph_builder.iter_graph_features, flood_zone_service.iter_geojson_features)
+- Không phụ thuộc graph/shapely → router nào cũng import được mà không kéo theo module routing
+"""
+from typing import Iterable, Iterator
+
+# Gom feature đã encode thành chunk ~64KB khi stream (không gửi từng feature vài trăm byte)
+GEOJSON_STREAM_CHUNK = 64 * 1024
+
+
+def iter_feature_collection(features: Iterable[bytes], chunk_size: int = GEOJSON_STREAM_CHUNK) -> Iterator[bytes]:
+    """
+    Bọc các feature đã encode thành FeatureCollection JSON theo từng chunk (cho StreamingResponse)
+    Bộ nhớ chỉ giữ 1 chunk thay vì cả list feature + bản encode
+    """
+    parts = [b'{"type":"FeatureCollection","features":[']
+    size = 0
+    first = True
+    for feature in features:
+        if not first:
+            parts.append(b",")
+        first = False
+        parts.append(feature)
+        size += len(feature)
+        if size >= chunk_size:
+            yield b"".join(parts)
+            parts = []
+            size = 0
+    parts.append(b"]}")
+    yield b"".join(parts)
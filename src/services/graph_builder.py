@@ -1,17 +1,34 @@
 # src/services/graph_builder.py
 """
 Module xây dựng graph tối ưu từ dữ liệu OSM
-Pipeline: Parse → Filter → LSCC → Compress → KD-Tree → STRtree
+Pipeline: Parse → Filter → LSCC → Compress → KD-Tree → ALT/CH → STRtree
 """
 import math
+import os
+import pickle
+import tempfile
 import numpy as np
-from scipy.spatial import KDTree
+import orjson
+from scipy.spatial import cKDTree
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
 from collections import defaultdict, deque
 from dataclasses import dataclass, field
-from typing import Dict, List, Tuple, Optional, Set
+from functools import cached_property
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple, Optional, Set
 from shapely.geometry import LineString, Polygon, Point, box
+import shapely
 from shapely import STRtree
 from .overpass_service import OSMData, OSMNode, OSMWay
+from .contraction_hierarchy import ContractionHierarchy
+
+# Numba (optional, fallback về compress_graph thuần Python trên dict nếu không có)
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
 
 
 # ======================================================================
@@ -63,6 +80,18 @@ C_CONTEXT = {
     }
 }
 
+# Bán kính Trái Đất (mét) - dùng chung cho haversine và phép chiếu KD-Tree
+EARTH_RADIUS = 6371000
+
+# Số landmark cho heuristic ALT (A*, Landmarks, Triangle inequality)
+ALT_LANDMARKS = 16
+
+# Batch nearest-node từ ngưỡng này trở lên mới query KD-Tree song song (workers=-1)
+KDTREE_PARALLEL_MIN = 512
+
+# Số điểm mỗi lá KD-Tree (mặc định scipy 16) - lá lớn hơn: cây nông hơn, build nhanh hơn
+KDTREE_LEAFSIZE = 32
+
 SPEED_LIMITS = {
     "motorway": 100, "motorway_link": 60,
     "trunk": 80, "trunk_link": 50,
@@ -78,8 +107,9 @@ SPEED_LIMITS = {
 # Data Classes
 # ======================================================================
 
-@dataclass
+@dataclass(slots=True)
 class GraphNode:
+    """Node graph - slots: không __dict__ riêng cho mỗi node (graph giữ hàng chục nghìn node)"""
     id: int
     lat: float
     lon: float
@@ -107,9 +137,20 @@ class GraphEdge:
         c_context = C_CONTEXT.get(weather, C_CONTEXT["normal"]).get(self.highway_type, 1.0)
         return self.length * self.c_highway * c_context
     
-    @property
+    @cached_property
     def travel_time(self) -> float:
+        # length/speed không đổi sau khi build → tính 1 lần cho mỗi edge, không phải mỗi lần dựng path
         return (self.length / 1000) / self.speed * 3600
+    
+    @property
+    def forward_geometry(self) -> List[Tuple[float, float]]:
+        # geometry luôn theo hướng from_node → to_node (build_raw_graph/compress_graph)
+        return self.geometry
+    
+    @cached_property
+    def reverse_geometry(self) -> List[Tuple[float, float]]:
+        # Chiều to_node → from_node, đảo 1 lần cho mỗi edge thay vì mỗi lần dựng path
+        return self.geometry[::-1]
 
 
 @dataclass
@@ -126,13 +167,42 @@ class LightGraph:
     # KD-Tree cho nearest node
     _node_ids: np.ndarray = None
     _node_coords: np.ndarray = None
-    _kdtree: KDTree = None
+    _kdtree: cKDTree = None  # Dựng trên tọa độ chiếu phẳng (mét), không phải độ
+    _proj_kx: float = None   # R * cos(lat0): mét / radian kinh độ tại vĩ độ trung bình
+    _node_degrees: np.ndarray = None  # Out-degree theo thứ tự _node_ids
+    _bounds: Tuple[float, float, float, float] = None  # (min_lat, min_lon, max_lat, max_lon)
     
     # STRtree cho spatial query (flood areas)
     _edge_geometries: List[LineString] = field(default_factory=list)
     _edge_keys: List[Tuple[int, int]] = field(default_factory=list)  # (from_node, to_node)
     _strtree: STRtree = None
     
+    # Dense index 0..N-1 (thứ tự _node_ids) cho A*: list index thay vì dict keyed bởi OSM ID 64-bit
+    node_index: Dict[int, int] = None
+    nodes_by_idx: List[GraphNode] = None
+    adjacency_by_idx: List[List[Tuple[int, int, int]]] = None  # (neighbor_idx, neighbor_id, edge_idx)
+    reverse_adjacency_by_idx: List[List[Tuple[int, int, int]]] = None  # (from_idx, from_id, edge_idx) của edge đi vào
+    edges_by_idx: List[GraphEdge] = None
+    
+    # CSR adjacency: edge của node u là edge_idx trong [csr_indptr[u], csr_indptr[u+1]),
+    # edge được đánh số theo thứ tự CSR nên edge_idx == vị trí k (không cần mảng edge_idx riêng)
+    csr_indptr: np.ndarray = None   # int32[N+1]
+    csr_indices: np.ndarray = None  # int32[E] - neighbor idx
+    lat_arr: np.ndarray = None      # float64[N] - tọa độ node theo dense idx (heuristic vectorized)
+    lon_arr: np.ndarray = None
+    
+    # ALT landmarks: weather → (khoảng cách từ landmark, khoảng cách đến landmark), shape (k, N)
+    landmark_idx: np.ndarray = None
+    _landmark_dists: Dict[str, Tuple[np.ndarray, np.ndarray]] = field(default_factory=dict)
+    # Contraction Hierarchies theo weather (build_contraction_hierarchies)
+    _contraction: Dict[str, ContractionHierarchy] = field(default_factory=dict)
+    # Cột edge theo edge_idx (build_csr): length * c_highway và mã highway_type (index vào _edge_highway_types)
+    _edge_base_weights: np.ndarray = None   # float64[E]
+    _edge_highway_codes: np.ndarray = None  # int16[E]
+    _edge_highway_types: List[str] = None
+    _weights_by_weather: Dict[str, List[float]] = field(default_factory=dict)  # weather → weight theo edge_idx
+    _weight_arrays: Dict[str, np.ndarray] = field(default_factory=dict)
+    
     def add_node(self, node: GraphNode):
         self.nodes[node.id] = node
         if node.id not in self.adjacency:
@@ -151,12 +221,201 @@ class LightGraph:
     def build_kdtree(self):
         if not self.nodes:
             return
-        node_list = list(self.nodes.items())
-        self._node_ids = np.array([nid for nid, _ in node_list])
-        self._node_coords = np.array([[n.lat, n.lon] for _, n in node_list])
-        self._kdtree = KDTree(self._node_coords)
+        # Một lượt qua dict (keys/values cùng thứ tự), không dựng list trung gian
+        self._node_ids = np.fromiter(self.nodes.keys(), dtype=np.int64, count=len(self.nodes))
+        self._node_coords = np.array([(n.lat, n.lon) for n in self.nodes.values()])
+        # cKDTree gọi thẳng bản C (KDTree chỉ là lớp bọc Python); node OSM phân bố khá đều
+        # nên bỏ bước chia theo median (balanced_tree) → build nhanh ~2x, query không chậm hơn
+        # Chiếu equirectangular quanh vĩ độ trung bình → khoảng cách Euclid trong cây là mét
+        # (1 độ kinh độ ngắn hơn 1 độ vĩ độ cos(lat) lần; sai số phẳng hóa cỡ 1 quận không đáng kể)
+        lat0 = float(self._node_coords[:, 0].mean())
+        self._proj_kx = EARTH_RADIUS * math.cos(math.radians(lat0))
+        self._kdtree = cKDTree(
+            self._project(self._node_coords),
+            leafsize=KDTREE_LEAFSIZE, balanced_tree=False, compact_nodes=False
+        )
+        # Bounds là thuộc tính của graph → tính 1 lần lúc build (min/max vectorized trên mảng [lat, lon])
+        min_lat, min_lon = self._node_coords.min(axis=0).tolist()
+        max_lat, max_lon = self._node_coords.max(axis=0).tolist()
+        self._bounds = (min_lat, min_lon, max_lat, max_lon)
         print(f"  KD-Tree: {len(self._node_ids)} nodes indexed")
     
+    def build_node_index(self):
+        """
+        Đánh số node liên tục theo thứ tự _node_ids (khớp KD-Tree, _node_degrees)
+        A* làm việc trên idx: g_score/came_from là list, closed_set là bytearray
+        """
+        if self._node_ids is None:
+            self.build_kdtree()
+        if self._node_ids is None:
+            return
+        ids = self._node_ids.tolist()
+        index = {nid: i for i, nid in enumerate(ids)}
+        self.node_index = index
+        self.nodes_by_idx = [self.nodes[nid] for nid in ids]
+        self.build_csr()
+        
+        # View dạng list-of-tuples cho vòng lặp A* thuần Python: iterate tuple nhanh hơn
+        # range(indptr[u], indptr[u+1]) + index từng phần tử trên CPython
+        indptr = self.csr_indptr.tolist()
+        indices = self.csr_indices.tolist()
+        self.adjacency_by_idx = [
+            [(indices[k], ids[indices[k]], k) for k in range(indptr[u], indptr[u + 1])]
+            for u in range(len(ids))
+        ]
+        reverse_adjacency_by_idx = [[] for _ in ids]
+        for u, row in enumerate(self.adjacency_by_idx):
+            for v, _, edge_idx in row:
+                reverse_adjacency_by_idx[v].append((u, ids[u], edge_idx))
+        self.reverse_adjacency_by_idx = reverse_adjacency_by_idx
+        self._weights_by_weather = {}
+        self._weight_arrays = {}
+        self._landmark_dists = {}
+        self._contraction = {}
+        # C_CONTEXT tĩnh → tính sẵn bảng weight của mọi weather ngay lúc build (đi cùng pickle cache)
+        for weather in C_CONTEXT:
+            self.weights_for(weather)
+    
+    def weights_array_for(self, weather: str) -> np.ndarray:
+        """
+        Weight theo edge_idx dạng float64 ndarray (cho kernel numba), cache theo weather
+        Vectorized: (length * c_highway) * c_context[highway_type] - cùng thứ tự nhân với GraphEdge.get_weight
+        """
+        if weather not in C_CONTEXT:
+            weather = "normal"
+        arr = self._weight_arrays.get(weather)
+        if arr is None:
+            if self._edge_base_weights is None:
+                self.build_node_index()
+            context = C_CONTEXT[weather]
+            factors = np.array([context.get(t, 1.0) for t in self._edge_highway_types], dtype=np.float64)
+            arr = self._edge_base_weights * factors[self._edge_highway_codes]
+            self._weight_arrays[weather] = arr
+        return arr
+    
+    def build_csr(self):
+        """
+        CSR (indptr/indices) theo dense idx, edges_by_idx cùng thứ tự
+        Edge idx nằm ngoài GraphEdge vì edge có thể dùng chung giữa các graph
+        """
+        index = self.node_index
+        edges: List[GraphEdge] = []
+        indices: List[int] = []
+        indptr = np.zeros(len(self.nodes_by_idx) + 1, dtype=np.int32)
+        for u, node in enumerate(self.nodes_by_idx):
+            for to_id, edge in self.get_neighbors(node.id):
+                indices.append(index[to_id])
+                edges.append(edge)
+            indptr[u + 1] = len(edges)
+        self.edges_by_idx = edges
+        self.csr_indptr = indptr
+        highway_codes: Dict[str, int] = {}
+        self._edge_highway_codes = np.array(
+            [highway_codes.setdefault(edge.highway_type, len(highway_codes)) for edge in edges], dtype=np.int16
+        )
+        self._edge_highway_types = list(highway_codes)
+        self._edge_base_weights = (
+            np.array([edge.length for edge in edges], dtype=np.float64)
+            * np.array([edge.c_highway for edge in edges], dtype=np.float64)
+        )
+        self.csr_indices = np.array(indices, dtype=np.int32)
+        self._node_degrees = np.diff(indptr)
+        # Dense idx theo thứ tự _node_ids = thứ tự hàng của _node_coords → tách cột (SoA liền bộ nhớ),
+        # không duyệt lại GraphNode
+        self.lat_arr = np.ascontiguousarray(self._node_coords[:, 0])
+        self.lon_arr = np.ascontiguousarray(self._node_coords[:, 1])
+    
+    def weights_for(self, weather: str) -> List[float]:
+        """
+        Weight của mọi edge (theo edge_idx) cho 1 chế độ thời tiết - tính 1 lần, cache trên graph
+        A* đọc W[edge_idx] thay vì gọi edge.get_weight(weather) mỗi lần mở rộng
+        (list float cho vòng lặp thuần Python, cùng giá trị với weights_array_for)
+        """
+        if weather not in C_CONTEXT:
+            weather = "normal"
+        weights = self._weights_by_weather.get(weather)
+        if weights is None:
+            weights = self.weights_array_for(weather).tolist()
+            self._weights_by_weather[weather] = weights
+        return weights
+    
+    def build_landmarks(self, k: int = ALT_LANDMARKS):
+        """
+        ALT: chọn k landmark (farthest-first trên weight "normal") rồi dựng bảng khoảng cách
+        cho mọi weather trong C_CONTEXT (lưu cùng graph khi pickle)
+        """
+        if self.csr_indptr is None:
+            self.build_node_index()
+        n = len(self.nodes_by_idx or ())
+        if n == 0:
+            return
+        
+        # Farthest-first: landmark kế tiếp là node xa nhất so với các landmark đã chọn
+        matrix = self._weight_matrix("normal")
+        landmarks = [0]
+        nearest = dijkstra(matrix, directed=True, indices=0)
+        for _ in range(1, min(k, n)):
+            nxt = int(np.argmax(np.where(np.isfinite(nearest), nearest, -1.0)))
+            if nearest[nxt] <= 0:
+                break
+            landmarks.append(nxt)
+            np.minimum(nearest, dijkstra(matrix, directed=True, indices=nxt), out=nearest)
+        
+        self.landmark_idx = np.array(landmarks, dtype=np.int32)
+        self._landmark_dists = {}
+        for weather in C_CONTEXT:
+            self.landmark_distances(weather)
+        print(f"  ALT: {len(landmarks)} landmarks × {len(C_CONTEXT)} weather")
+    
+    def landmark_distances(self, weather: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (from, to) shape (k, N): from[i, v] = d(L_i, v), to[i, v] = d(v, L_i) theo weight của weather
+        Penalty vùng ngập >= 1 chỉ làm weight tăng → vẫn là cận dưới hợp lệ
+        """
+        if weather not in C_CONTEXT:
+            weather = "normal"
+        dists = self._landmark_dists.get(weather)
+        if dists is None:
+            matrix = self._weight_matrix(weather)
+            landmarks = self.landmark_idx
+            dists = (
+                dijkstra(matrix, directed=True, indices=landmarks),
+                dijkstra(matrix.T.tocsr(), directed=True, indices=landmarks)
+            )
+            self._landmark_dists[weather] = dists
+        return dists
+    
+    def build_contraction_hierarchies(self):
+        """CH cho mọi weather trong C_CONTEXT (lưu cùng graph khi pickle)"""
+        if self.csr_indptr is None:
+            self.build_node_index()
+        if not self.nodes_by_idx:
+            return
+        self._contraction = {
+            weather: ContractionHierarchy.build(self.csr_indptr, self.csr_indices, self.weights_for(weather))
+            for weather in C_CONTEXT
+        }
+        print(f"  CH: {len(self._contraction)} weather")
+    
+    def contraction_for(self, weather: str) -> Optional[ContractionHierarchy]:
+        """CH đã build của weather, None nếu chưa build (không build lazy trong request)"""
+        if weather not in C_CONTEXT:
+            weather = "normal"
+        return self._contraction.get(weather)
+    
+    def _weight_matrix(self, weather: str) -> csr_matrix:
+        """Ma trận kề (N, N) theo weight của weather; edge song song giữ weight nhỏ nhất"""
+        n = len(self.nodes_by_idx)
+        rows = np.repeat(np.arange(n, dtype=np.int32), np.diff(self.csr_indptr))
+        cols = self.csr_indices
+        weights = np.asarray(self.weights_for(weather), dtype=np.float64)
+        # csr_matrix cộng dồn duplicate → sort theo (u, v, weight) và chỉ giữ entry đầu mỗi (u, v)
+        order = np.lexsort((weights, cols, rows))
+        rows, cols, weights = rows[order], cols[order], weights[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        return csr_matrix((weights[first], (rows[first], cols[first])), shape=(n, n))
+    
     def build_strtree(self):
         """
         Build STRtree spatial index cho tất cả edges.
@@ -165,26 +424,33 @@ class LightGraph:
         if not self.adjacency:
             return
         
-        self._edge_geometries = []
-        self._edge_keys = []
-        
+        # Gom tọa độ mọi edge vào 1 mảng phẳng + chỉ số edge → shapely.linestrings tạo
+        # toàn bộ LineString trong 1 lần gọi C (không dựng LineString(...) từng edge)
+        coords: List[Tuple[float, float]] = []
+        line_ids: List[int] = []
+        edge_keys: List[Tuple[int, int]] = []
         for from_node, neighbors in self.adjacency.items():
             for to_node, edge in neighbors:
-                # Tạo LineString từ geometry của edge
                 if edge.geometry and len(edge.geometry) >= 2:
-                    line = LineString(edge.geometry)
+                    points = edge.geometry
                 else:
                     # Fallback: dùng tọa độ 2 nodes
                     from_n = self.nodes.get(from_node)
                     to_n = self.nodes.get(to_node)
                     if from_n and to_n:
-                        line = LineString([(from_n.lon, from_n.lat), (to_n.lon, to_n.lat)])
+                        points = [(from_n.lon, from_n.lat), (to_n.lon, to_n.lat)]
                     else:
                         continue
                 
-                self._edge_geometries.append(line)
-                self._edge_keys.append((from_node, to_node))
+                coords.extend(points)
+                line_ids.extend([len(edge_keys)] * len(points))
+                edge_keys.append((from_node, to_node))
         
+        self._edge_keys = edge_keys
+        self._edge_geometries = (
+            list(shapely.linestrings(np.asarray(coords, dtype=np.float64), indices=line_ids))
+            if edge_keys else []
+        )
         self._strtree = STRtree(self._edge_geometries)
         print(f"  STRtree: {len(self._edge_geometries)} edges indexed")
     
@@ -205,21 +471,33 @@ class LightGraph:
         if self._strtree is None:
             return []
         
-        # STRtree query - trả về indices của geometries có bounding box intersect
-        indices = self._strtree.query(geom)
+        # STRtree query kèm predicate: lọc bbox + kiểm tra intersects chính xác với LineString
+        # thực tế của edge (prepared geometry) trong 1 lần gọi C, không lặp Python từng ứng viên
+        indices = self._strtree.query(geom, predicate="intersects")
+        edge_keys = self._edge_keys
+        return [edge_keys[idx] for idx in indices.tolist()]
+    
+    def query_edges_in_geometries(self, geoms: List[Any]) -> List[List[Tuple[int, int]]]:
+        """
+        Bản bulk của query_edges_in_geometry: 1 lần STRtree.query cho cả danh sách geometry
         
-        affected_edges = []
-        for idx in indices:
-            edge_line = self._edge_geometries[idx]
-            # Double check với actual intersection - sử dụng geometry thực tế của edge
-            # STRtree chỉ check bounding box, cần check chính xác với LineString
-            if edge_line.intersects(geom):
-                edge_key = self._edge_keys[idx]
-                affected_edges.append(edge_key)
-                # Block cả 2 chiều để đảm bảo hard block
-                # (nếu edge có chiều ngược lại, nó sẽ được thêm khi query chiều ngược)
+        Returns:
+            List (cùng thứ tự geoms) các list (from_node, to_node) bị ảnh hưởng
+        """
+        if not geoms:
+            return []
+        if self._strtree is None:
+            self.build_strtree()
+        if self._strtree is None:
+            return [[] for _ in geoms]
         
-        return affected_edges
+        # (input_idx, tree_idx) - gom theo input_idx bằng sort ổn định + split tại biên
+        input_idx, tree_idx = self._strtree.query(geoms, predicate="intersects")
+        order = np.argsort(input_idx, kind="stable")
+        input_idx, tree_idx = input_idx[order], tree_idx[order]
+        bounds = np.searchsorted(input_idx, np.arange(1, len(geoms)))
+        edge_keys = self._edge_keys
+        return [[edge_keys[idx] for idx in chunk.tolist()] for chunk in np.split(tree_idx, bounds)]
     
     def query_nodes_in_geometry(self, geom, min_degree: int = 3) -> Set[int]:
         """
@@ -232,27 +510,29 @@ class LightGraph:
         Returns:
             Set of node IDs có degree >= min_degree và nằm trong geometry
         
-        Performance: O(N) - duyệt qua tất cả nodes, nhưng chỉ check degree và contains
+        Performance: lọc degree + bbox bằng numpy, chỉ test chính xác các node ứng viên
         """
-        blocked_nodes = set()
-        
         if not self.nodes:
-            return blocked_nodes
+            return set()
+        if self._node_coords is None:
+            self.build_kdtree()
+        if self._node_degrees is None:
+            self.build_node_index()  # Out-degree = np.diff(csr_indptr)
         
-        for node_id, node in self.nodes.items():
-            # Kiểm tra node có nằm trong geometry không
-            from shapely.geometry import Point
-            node_point = Point(node.lon, node.lat)
-            
-            if geom.contains(node_point) or geom.intersects(node_point):
-                # Kiểm tra degree (số lượng neighbors)
-                degree = len(self.get_neighbors(node_id))
-                
-                # Chỉ block các đỉnh bậc >= min_degree (ngã 3, ngã 4, ...)
-                if degree >= min_degree:
-                    blocked_nodes.add(node_id)
+        # Chỉ xét đỉnh bậc >= min_degree (ngã 3, ngã 4, ...) nằm trong bbox của geometry
+        lats, lons = self._node_coords[:, 0], self._node_coords[:, 1]
+        min_lon, min_lat, max_lon, max_lat = geom.bounds
+        candidates = np.flatnonzero(
+            (self._node_degrees >= min_degree)
+            & (lats >= min_lat) & (lats <= max_lat)
+            & (lons >= min_lon) & (lons <= max_lon)
+        )
+        if candidates.size == 0:
+            return set()
         
-        return blocked_nodes
+        # Point-in-geometry vectorized trên mảng tọa độ có sẵn, không tạo Point cho từng node
+        inside = shapely.intersects_xy(geom, lons[candidates], lats[candidates])
+        return set(self._node_ids[candidates[inside]].tolist())
     
     def get_node_degree(self, node_id: int) -> int:
         """
@@ -266,14 +546,40 @@ class LightGraph:
         """
         return len(self.get_neighbors(node_id))
     
+    def _project(self, coords: np.ndarray) -> np.ndarray:
+        """[lat, lon] (độ) → [x, y] (mét) theo phép chiếu của KD-Tree"""
+        rad = np.radians(coords)
+        return np.column_stack((rad[..., 1] * self._proj_kx, rad[..., 0] * EARTH_RADIUS))
+    
     def find_nearest_node(self, lat: float, lon: float) -> Optional[int]:
         if self._kdtree is None:
             self.build_kdtree()
         if self._kdtree is None:
             return None
-        _, idx = self._kdtree.query([lat, lon])
+        _, idx = self._kdtree.query(
+            (math.radians(lon) * self._proj_kx, math.radians(lat) * EARTH_RADIUS)
+        )
         return int(self._node_ids[idx])
     
+    def find_nearest_nodes(self, coords: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Batch nearest node: một lần duyệt KD-Tree cho nhiều điểm
+        
+        Args:
+            coords: Array (k, 2) các điểm [lat, lon]
+        
+        Returns:
+            Array (k,) node IDs, hoặc None nếu graph rỗng
+        """
+        if self._kdtree is None:
+            self.build_kdtree()
+        if self._kdtree is None:
+            return None
+        # Batch lớn (matrix/isochrone) mới chia cho mọi core; vài điểm thì spawn thread tốn hơn query
+        workers = -1 if len(coords) >= KDTREE_PARALLEL_MIN else 1
+        _, idx = self._kdtree.query(self._project(np.asarray(coords, dtype=np.float64)), k=1, workers=workers)
+        return self._node_ids[idx]
+    
     def get_neighbors(self, node_id: int) -> List[Tuple[int, GraphEdge]]:
         return self.adjacency.get(node_id, [])
     
@@ -283,6 +589,18 @@ class LightGraph:
     def has_node(self, node_id: int) -> bool:
         return node_id in self.nodes
     
+    def edge_ids_of(self, from_id: int, to_id: int) -> List[int]:
+        """
+        edge_idx (vị trí CSR, index của weights_for/edges_by_idx) của các edge from → to
+        Có thể > 1 phần tử nếu 2 node nối bởi nhiều way song song
+        """
+        if self.adjacency_by_idx is None:
+            self.build_node_index()
+        u = self.node_index.get(from_id)
+        if u is None:
+            return []
+        return [edge_idx for _, neighbor_id, edge_idx in self.adjacency_by_idx[u] if neighbor_id == to_id]
+    
     @property
     def node_count(self) -> int:
         return len(self.nodes)
@@ -294,9 +612,9 @@ class LightGraph:
     def get_bounds(self) -> Tuple[float, float, float, float]:
         if not self.nodes:
             return (0, 0, 0, 0)
-        lats = [n.lat for n in self.nodes.values()]
-        lons = [n.lon for n in self.nodes.values()]
-        return (min(lats), min(lons), max(lats), max(lons))
+        if self._bounds is None:
+            self.build_kdtree()
+        return self._bounds
 
 
 # ======================================================================
@@ -312,6 +630,16 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
 
+def haversine_array(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """haversine_distance vectorized trên mảng float64 (meters) - cùng công thức, 1 lượt C loop"""
+    R = 6371000
+    lat1_rad, lat2_rad = np.radians(lat1), np.radians(lat2)
+    delta_lat = np.radians(lat2 - lat1)
+    delta_lon = np.radians(lon2 - lon1)
+    a = np.sin(delta_lat / 2) ** 2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(delta_lon / 2) ** 2
+    return R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
 def is_oneway(tags: dict) -> bool:
     return tags.get("oneway", "no") in ("yes", "1", "true", "-1")
 
@@ -346,7 +674,34 @@ def build_raw_graph(osm_data: OSMData, valid_ways: List[OSMWay]) -> LightGraph:
             osm_node = osm_data.nodes[node_id]
             graph.add_node(GraphNode(id=osm_node.id, lat=osm_node.lat, lon=osm_node.lon))
     
+    # Build full geometry từ tất cả nodes trong way, đồng thời gom tọa độ mọi way
+    # vào 1 mảng phẳng → khoảng cách mọi cặp điểm liên tiếp tính bằng 1 lần haversine_array
+    way_geometries = []
+    way_offsets = []
+    flat_coords: List[Tuple[float, float]] = []
     for way in valid_ways:
+        way_geometry = []
+        for node_id in way.nodes:
+            if node_id in graph.nodes:
+                node = graph.nodes[node_id]
+                way_geometry.append((node.lon, node.lat))
+        way_geometries.append(way_geometry)
+        way_offsets.append(len(flat_coords))
+        flat_coords.extend(way_geometry)
+    
+    # step_dist[k] = haversine(flat_coords[k], flat_coords[k + 1]) (cặp nối 2 way khác nhau không dùng tới)
+    if len(flat_coords) >= 2:
+        coords_arr = np.array(flat_coords, dtype=np.float64)
+        step_dist = haversine_array(
+            coords_arr[:-1, 1], coords_arr[:-1, 0], coords_arr[1:, 1], coords_arr[1:, 0]
+        ).tolist()
+    else:
+        step_dist = []
+    
+    for way, way_geometry, offset in zip(valid_ways, way_geometries, way_offsets):
+        if len(way_geometry) < 2:
+            continue
+        
         highway_type = way.tags.get("highway", "unclassified")
         name = way.tags.get("name", "")
         speed = SPEED_LIMITS.get(highway_type, 30)
@@ -355,25 +710,13 @@ def build_raw_graph(osm_data: OSMData, valid_ways: List[OSMWay]) -> LightGraph:
         oneway = is_oneway(way.tags)
         reverse = is_reverse_oneway(way.tags)
         
-        # Build full geometry từ tất cả nodes trong way
-        way_geometry = []
-        for node_id in way.nodes:
-            if node_id in graph.nodes:
-                node = graph.nodes[node_id]
-                way_geometry.append((node.lon, node.lat))
+        # Mọi node của way đều có trong graph → index trong way.nodes trùng index trong way_geometry
+        aligned = len(way_geometry) == len(way.nodes)
         
-        if len(way_geometry) < 2:
-            continue
-        
-        # Tính tổng length của way
-        total_way_length = 0.0
-        for i in range(len(way_geometry) - 1):
-            p1 = way_geometry[i]
-            p2 = way_geometry[i + 1]
-            total_way_length += haversine_distance(
-                p1[1], p1[0],  # lat, lon
-                p2[1], p2[0]
-            )
+        # Index đầu tiên của mỗi node trong way.nodes (như way.nodes.index, không quét lại O(n))
+        first_index: Dict[int, int] = {}
+        for i, node_id in enumerate(way.nodes):
+            first_index.setdefault(node_id, i)
         
         # Tạo edges cho từng segment với geometry chi tiết
         for i in range(len(way.nodes) - 1):
@@ -381,12 +724,9 @@ def build_raw_graph(osm_data: OSMData, valid_ways: List[OSMWay]) -> LightGraph:
             if from_id not in graph.nodes or to_id not in graph.nodes:
                 continue
             
-            from_node, to_node = graph.nodes[from_id], graph.nodes[to_id]
-            
             # Lấy geometry cho segment này từ way_geometry
-            # Tìm index của from_id và to_id trong way.nodes
-            from_idx = way.nodes.index(from_id)
-            to_idx = way.nodes.index(to_id)
+            from_idx = first_index[from_id]
+            to_idx = first_index[to_id]
             
             # Lấy geometry từ from_idx đến to_idx (bao gồm cả 2 điểm)
             if from_idx < to_idx:
@@ -395,11 +735,16 @@ def build_raw_graph(osm_data: OSMData, valid_ways: List[OSMWay]) -> LightGraph:
                 # Reverse case
                 segment_geometry = list(reversed(way_geometry[to_idx:from_idx + 1]))
             
-            # Tính length cho segment này
-            segment_length = haversine_distance(
-                from_node.lat, from_node.lon,
-                to_node.lat, to_node.lon
-            )
+            # Tính length cho segment này: 2 node liền nhau → tra step_dist đã vectorized
+            # (haversine đối xứng nên chiều ngược dùng chung cặp điểm)
+            if aligned and abs(to_idx - from_idx) == 1:
+                segment_length = step_dist[offset + min(from_idx, to_idx)]
+            else:
+                from_node, to_node = graph.nodes[from_id], graph.nodes[to_id]
+                segment_length = haversine_distance(
+                    from_node.lat, from_node.lon,
+                    to_node.lat, to_node.lon
+                )
             
             # Nếu segment có nhiều điểm, tính length chính xác hơn
             if len(segment_geometry) > 2:
@@ -438,71 +783,44 @@ def build_raw_graph(osm_data: OSMData, valid_ways: List[OSMWay]) -> LightGraph:
 
 
 # ======================================================================
-# Step 2: LSCC Filtering (Kosaraju's Algorithm)
+# Step 2: LSCC Filtering (scipy csgraph SCC trên CSR)
 # ======================================================================
 
 def find_largest_scc(graph: LightGraph) -> Set[int]:
     """
-    Tìm Largest Strongly Connected Component (LSCC) sử dụng Kosaraju's Algorithm
+    Tìm Largest Strongly Connected Component (LSCC)
     Đây là "Lục địa chính" - đảm bảo từ bất kỳ node nào cũng đến được node khác
+    
+    Dựng CSR (node_id → row) 1 lần rồi gọi connected_components(connection="strong")
+    của scipy (SCC 1 lượt DFS viết bằng C) thay cho Kosaraju 2 lượt DFS thuần Python
     """
     if not graph.nodes:
         return set()
     
-    # Step 1: DFS trên graph gốc, ghi nhận finish time
-    visited = set()
-    finish_order = []
+    node_ids = list(graph.nodes)
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    n = len(node_ids)
     
-    def dfs1(node):
-        stack = [(node, False)]
-        while stack:
-            n, processed = stack.pop()
-            if processed:
-                finish_order.append(n)
-                continue
-            if n in visited:
-                continue
-            visited.add(n)
-            stack.append((n, True))
-            for neighbor, _ in graph.adjacency.get(n, []):
-                if neighbor not in visited:
-                    stack.append((neighbor, False))
-    
-    for node_id in graph.nodes:
-        if node_id not in visited:
-            dfs1(node_id)
-    
-    # Step 2: DFS trên reverse graph theo thứ tự finish time giảm dần
-    visited.clear()
-    sccs = []
-    
-    def dfs2(start):
-        component = []
-        stack = [start]
-        while stack:
-            n = stack.pop()
-            if n in visited:
-                continue
-            visited.add(n)
-            component.append(n)
-            for neighbor, _ in graph.reverse_adjacency.get(n, []):
-                if neighbor not in visited:
-                    stack.append(neighbor)
-        return component
-    
-    for node_id in reversed(finish_order):
-        if node_id not in visited:
-            scc = dfs2(node_id)
-            sccs.append(scc)
+    # CSR theo row = vị trí node trong graph.nodes (edge luôn nối 2 node đã add_node)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(graph.adjacency.get(node_id, ())) for node_id in node_ids])
+    indices = np.array(
+        [index[neighbor] for node_id in node_ids for neighbor, _ in graph.adjacency.get(node_id, ())],
+        dtype=np.int32
+    )
+    adjacency = csr_matrix((np.ones(len(indices), dtype=np.int8), indices, indptr), shape=(n, n))
+    n_components, labels = connected_components(adjacency, directed=True, connection="strong")
     
     # Tìm SCC lớn nhất
-    largest_scc = max(sccs, key=len) if sccs else []
+    sizes = np.bincount(labels)
+    largest = np.flatnonzero(labels == sizes.argmax())
+    largest_scc = [node_ids[i] for i in largest.tolist()]
     
-    print(f"  SCC Analysis: {len(sccs)} components found")
+    print(f"  SCC Analysis: {n_components} components found")
     print(f"  LSCC (Lục địa chính): {len(largest_scc)} nodes ({len(largest_scc)*100//graph.node_count}%)")
     
     # Log các ốc đảo bị loại bỏ
-    islands_count = len(sccs) - 1
+    islands_count = n_components - 1
     islands_nodes = graph.node_count - len(largest_scc)
     if islands_count > 0:
         print(f"  Loại bỏ: {islands_count} ốc đảo ({islands_nodes} nodes)")
@@ -510,44 +828,96 @@ def find_largest_scc(graph: LightGraph) -> Set[int]:
     return set(largest_scc)
 
 
-def filter_to_lscc(graph: LightGraph, lscc_nodes: Set[int]) -> LightGraph:
-    """Lọc graph chỉ giữ lại các nodes trong LSCC"""
-    filtered = LightGraph()
+# ======================================================================
+# Step 3: Geometry Packing (Compress degree-2 nodes)
+# ======================================================================
+
+def compress_graph(graph: LightGraph, lscc_nodes: Optional[Set[int]] = None) -> LightGraph:
+    """
+    Nén đồ thị: merge các node bậc 2, giữ geometry đầy đủ
     
-    for node_id in lscc_nodes:
-        if node_id in graph.nodes:
-            filtered.add_node(graph.nodes[node_id])
+    lscc_nodes: nếu có, lọc LSCC ngay trong lượt nén (node/cạnh ngoài LSCC coi như không tồn tại)
+    thay vì lọc toàn bộ adjacency trước rồi mới duyệt lại lần nữa
     
-    for from_node, neighbors in graph.adjacency.items():
-        if from_node not in lscc_nodes:
-            continue
-        for to_node, edge in neighbors:
-            if to_node in lscc_nodes:
-                filtered.add_edge(edge)
+    Có numba: phân loại node bậc 2 + đi chuỗi chạy trong kernel trên CSR int32 (_compress_graph_csr),
+    không thì duyệt dict/set thuần Python (_compress_graph_dict) - 2 cách cho cùng graph
+    """
+    if HAS_NUMBA:
+        compressed, nodes_before, edges_before = _compress_graph_csr(graph, lscc_nodes)
+    else:
+        compressed, nodes_before, edges_before = _compress_graph_dict(graph, lscc_nodes)
+    
+    shared = _share_twin_geometry(compressed)
+    print(f"  Compress: {nodes_before} → {compressed.node_count} nodes, "
+          f"{edges_before} → {compressed.edge_count} edges ({shared} cặp 2 chiều dùng chung geometry)")
     
-    return filtered
+    return compressed
 
 
-# ======================================================================
-# Step 3: Geometry Packing (Compress degree-2 nodes)
-# ======================================================================
+def _share_twin_geometry(graph: LightGraph) -> int:
+    """
+    Đường 2 chiều: edge u → v và v → u (cùng way, geometry đảo nhau) trỏ chung 2 list -
+    reverse_geometry của mỗi chiều chính là geometry của chiều kia, không đảo/copy riêng cho từng edge
+    (tuple tọa độ vốn đã dùng chung từ way_geometry của build_raw_graph)
+    
+    Returns:
+        Số cặp edge đã nối
+    """
+    pending: Dict[Tuple[int, int, int, int], List[GraphEdge]] = defaultdict(list)
+    pairs = 0
+    for from_id, neighbors in graph.adjacency.items():
+        for to_id, edge in neighbors:
+            geometry = edge.geometry
+            if len(geometry) < 2:
+                continue
+            candidates = pending.get((to_id, from_id, edge.way_id, len(geometry)))
+            twin = None
+            if candidates:
+                for i, other in enumerate(candidates):
+                    if other.geometry[::-1] == geometry:
+                        twin = candidates.pop(i)
+                        break
+            if twin is None:
+                pending[(from_id, to_id, edge.way_id, len(geometry))].append(edge)
+                continue
+            # cached_property: gán thẳng vào instance → lần đọc sau không tính lại
+            edge.reverse_geometry = twin.geometry
+            twin.reverse_geometry = geometry
+            pairs += 1
+    return pairs
 
-def compress_graph(graph: LightGraph) -> LightGraph:
-    """Nén đồ thị: merge các node bậc 2, giữ geometry đầy đủ"""
+
+def _compress_graph_dict(graph: LightGraph, lscc_nodes: Optional[Set[int]]) -> Tuple[LightGraph, int, int]:
+    """compress_graph thuần Python: set neighbor/highway_type cho từng node, đi chuỗi trên dict adjacency"""
     compressed = LightGraph()
     
     nodes_to_keep: Set[int] = set()
     degree_2_nodes: Set[int] = set()
     
+    # Adjacency trong LSCC: list gốc nếu mọi neighbor thuộc LSCC (đa số), chỉ copy list có cạnh ra ngoài
+    def within(neighbors):
+        if lscc_nodes is None:
+            return neighbors
+        for n, _ in neighbors:
+            if n not in lscc_nodes:
+                return [(n, e) for n, e in neighbors if n in lscc_nodes]
+        return neighbors
+    
+    out_map: Dict[int, List[Tuple[int, GraphEdge]]] = {}
+    edges_before = 0
     for node_id in graph.nodes:
-        out_neighbors = set(n for n, _ in graph.adjacency.get(node_id, []))
-        in_neighbors = set(n for n, _ in graph.reverse_adjacency.get(node_id, []))
-        unique_neighbors = out_neighbors | in_neighbors
+        if lscc_nodes is not None and node_id not in lscc_nodes:
+            continue
+        outs = out_map[node_id] = within(graph.adjacency.get(node_id, ()))
+        ins = within(graph.reverse_adjacency.get(node_id, ()))
+        edges_before += len(outs)
+        unique_neighbors = set(n for n, _ in outs)
+        unique_neighbors.update(n for n, _ in ins)
         
         if len(unique_neighbors) == 2:
-            out_types = set(e.highway_type for _, e in graph.adjacency.get(node_id, []))
-            in_types = set(e.highway_type for _, e in graph.reverse_adjacency.get(node_id, []))
-            if len(out_types | in_types) == 1:
+            types = set(e.highway_type for _, e in outs)
+            types.update(e.highway_type for _, e in ins)
+            if len(types) == 1:
                 degree_2_nodes.add(node_id)
             else:
                 nodes_to_keep.add(node_id)
@@ -560,7 +930,7 @@ def compress_graph(graph: LightGraph) -> LightGraph:
     processed_edges: Set[Tuple[int, int]] = set()
     
     for start_node in nodes_to_keep:
-        for neighbor_id, edge in graph.adjacency.get(start_node, []):
+        for neighbor_id, edge in out_map[start_node]:
             if (start_node, neighbor_id) in processed_edges:
                 continue
             
@@ -571,7 +941,7 @@ def compress_graph(graph: LightGraph) -> LightGraph:
             current, prev = neighbor_id, start_node
             
             while current in degree_2_nodes:
-                next_edges = [(n, e) for n, e in graph.adjacency.get(current, []) if n != prev]
+                next_edges = [(n, e) for n, e in out_map[current] if n != prev]
                 if not next_edges:
                     break
                 next_node, next_edge = next_edges[0]
@@ -590,10 +960,157 @@ def compress_graph(graph: LightGraph) -> LightGraph:
                 compressed.add_edge(new_edge)
                 processed_edges.add((start_node, end_node))
     
-    print(f"  Compress: {graph.node_count} → {compressed.node_count} nodes, "
-          f"{graph.edge_count} → {compressed.edge_count} edges")
+    return compressed, len(out_map), edges_before
+
+
+def _degree2_mask(indptr, indices, highway_codes):
+    """
+    Node bậc 2 cần gộp: đúng 2 neighbor phân biệt (vào ∪ ra) và mọi edge vào/ra cùng highway_type
+    Mỗi node giữ 2 slot neighbor + cờ "nhiều hơn 2" thay vì dựng set → thuần số, compile được bằng numba
+    """
+    n = len(indptr) - 1
+    nb1 = np.full(n, -1, dtype=np.int64)
+    nb2 = np.full(n, -1, dtype=np.int64)
+    many = np.zeros(n, dtype=np.bool_)
+    type1 = np.full(n, -1, dtype=np.int64)
+    mixed = np.zeros(n, dtype=np.bool_)
+    for u in range(n):
+        for k in range(indptr[u], indptr[u + 1]):
+            v = np.int64(indices[k])
+            t = highway_codes[k]
+            # Edge u → v: v là neighbor (ra) của u, u là neighbor (vào) của v
+            _add_neighbor(nb1, nb2, many, type1, mixed, u, v, t)
+            _add_neighbor(nb1, nb2, many, type1, mixed, v, u, t)
+    return (nb2 >= 0) & ~many & ~mixed
+
+
+def _add_neighbor(nb1, nb2, many, type1, mixed, a, b, t):
+    """Ghi neighbor b (qua edge loại t) vào 2 slot của node a"""
+    if nb1[a] < 0:
+        nb1[a] = b
+    elif nb1[a] != b:
+        if nb2[a] < 0:
+            nb2[a] = b
+        elif nb2[a] != b:
+            many[a] = True
+    if type1[a] < 0:
+        type1[a] = t
+    elif type1[a] != t:
+        mixed[a] = True
+
+
+def _walk_chains(indptr, indices, degree2, starts):
+    """
+    Từ mỗi edge ra của node giữ lại (theo thứ tự starts, rồi thứ tự CSR) đi qua chuỗi node bậc 2
+    cho tới node giữ lại / ngõ cụt
     
-    return compressed
+    Returns:
+        (cand_end, chain_ptr, chain) - candidate c (edge ra thứ c) kết thúc ở cand_end[c],
+        edge_idx nối tiếp sau edge đầu là chain[chain_ptr[c]:chain_ptr[c+1]]
+    """
+    total = 0
+    for s in starts:
+        total += indptr[s + 1] - indptr[s]
+    cand_end = np.empty(total, dtype=np.int64)
+    chain_ptr = np.zeros(total + 1, dtype=np.int64)
+    chain = np.empty(max(total, 16), dtype=np.int64)
+    c = 0
+    m = 0
+    for s in starts:
+        for k in range(indptr[s], indptr[s + 1]):
+            prev = s
+            current = indices[k]
+            while degree2[current]:
+                # Edge ra đầu tiên không quay lại node vừa đi qua
+                nxt = -1
+                for k2 in range(indptr[current], indptr[current + 1]):
+                    if indices[k2] != prev:
+                        nxt = k2
+                        break
+                if nxt < 0:
+                    break
+                if m == len(chain):
+                    grown = np.empty(2 * m, dtype=np.int64)
+                    grown[:m] = chain
+                    chain = grown
+                chain[m] = nxt
+                m += 1
+                prev = current
+                current = indices[nxt]
+            cand_end[c] = current
+            c += 1
+            chain_ptr[c] = m
+    return cand_end, chain_ptr, chain[:m]
+
+
+if HAS_NUMBA:
+    # _add_neighbor compile trước: _degree2_mask gọi bản njit qua global của module
+    _add_neighbor = njit(cache=True)(_add_neighbor)
+    _degree2_mask = njit(cache=True)(_degree2_mask)
+    _walk_chains = njit(cache=True)(_walk_chains)
+
+
+def _compress_graph_csr(graph: LightGraph, lscc_nodes: Optional[Set[int]]) -> Tuple[LightGraph, int, int]:
+    """
+    compress_graph trên CSR: dựng indptr/indices/highway code (đã lọc LSCC) 1 lượt,
+    phân loại + đi chuỗi bằng kernel, Python chỉ ghép geometry và tạo GraphEdge cho edge đã nén
+    """
+    compressed = LightGraph()
+    
+    ids = [node_id for node_id in graph.nodes if lscc_nodes is None or node_id in lscc_nodes]
+    index = {node_id: i for i, node_id in enumerate(ids)}
+    edges: List[GraphEdge] = []
+    indices: List[int] = []
+    indptr = np.zeros(len(ids) + 1, dtype=np.int32)
+    for i, node_id in enumerate(ids):
+        for neighbor, edge in graph.adjacency.get(node_id, ()):
+            j = index.get(neighbor)
+            if j is not None:
+                indices.append(j)
+                edges.append(edge)
+        indptr[i + 1] = len(edges)
+    indices_arr = np.array(indices, dtype=np.int32)
+    highway_codes: Dict[str, int] = {}
+    codes = np.array([highway_codes.setdefault(e.highway_type, len(highway_codes)) for e in edges], dtype=np.int16)
+    
+    degree2 = _degree2_mask(indptr, indices_arr, codes)
+    # Thứ tự add như bản dict (set dựng theo thứ tự graph.nodes) → graph nén giống hệt
+    nodes_to_keep: Set[int] = set(node_id for node_id, d2 in zip(ids, degree2.tolist()) if not d2)
+    for node_id in nodes_to_keep:
+        compressed.add_node(graph.nodes[node_id])
+    starts = np.array([index[node_id] for node_id in nodes_to_keep], dtype=np.int64)
+    cand_end, chain_ptr, chain = _walk_chains(indptr, indices_arr, degree2, starts)
+    
+    cand_end = cand_end.tolist()
+    chain_ptr = chain_ptr.tolist()
+    chain = chain.tolist()
+    degree2 = degree2.tolist()
+    indptr = indptr.tolist()
+    processed_edges: Set[Tuple[int, int]] = set()
+    c = 0
+    for start_node, s in zip(nodes_to_keep, starts.tolist()):
+        for k in range(indptr[s], indptr[s + 1]):
+            end = cand_end[c]
+            lo, hi = chain_ptr[c], chain_ptr[c + 1]
+            c += 1
+            if (start_node, ids[indices[k]]) in processed_edges or degree2[end]:
+                continue
+            edge = edges[k]
+            geometry = list(edge.geometry)
+            total_length = edge.length
+            for k2 in chain[lo:hi]:
+                next_edge = edges[k2]
+                if next_edge.geometry:
+                    geometry.extend(next_edge.geometry[1:])
+                total_length += next_edge.length
+            end_node = ids[end]
+            compressed.add_edge(GraphEdge(
+                start_node, end_node, edge.way_id, total_length,
+                edge.highway_type, edge.name, edge.speed, edge.c_highway, geometry
+            ))
+            processed_edges.add((start_node, end_node))
+    
+    return compressed, len(ids), len(edges)
 
 
 # ======================================================================
@@ -606,8 +1123,8 @@ def build_graph_from_osm(osm_data: OSMData) -> LightGraph:
     1. Parse & Filter ways
     2. Build raw graph
     3. LSCC Filtering (loại bỏ ốc đảo)
-    4. Compress (gom node bậc 2)
-    5. Build KD-Tree (nearest node query)
+    4. Compress (gom node bậc 2) - lọc LSCC của bước 3 ngay trong lượt nén
+    5. Build KD-Tree (nearest node query) + dense node index + ALT landmarks + Contraction Hierarchies
     6. Build STRtree (flood area spatial query)
     """
     print("Building graph...")
@@ -627,13 +1144,14 @@ def build_graph_from_osm(osm_data: OSMData) -> LightGraph:
         print("  Không tìm thấy LSCC!")
         return LightGraph()
     
-    lscc_graph = filter_to_lscc(raw_graph, lscc_nodes)
-    
     # Step 4: Compress - BẬT
-    final_graph = compress_graph(lscc_graph)
+    final_graph = compress_graph(raw_graph, lscc_nodes)
     
     # Step 5: KD-Tree (nearest node - O(log N))
     final_graph.build_kdtree()
+    final_graph.build_node_index()
+    final_graph.build_landmarks()
+    final_graph.build_contraction_hierarchies()
     
     # Step 6: STRtree (flood area spatial query - O(log N))
     final_graph.build_strtree()
@@ -647,8 +1165,8 @@ def build_graph_from_osm(osm_data: OSMData) -> LightGraph:
 # Export Functions
 # ======================================================================
 
-def graph_to_geojson(graph: LightGraph) -> dict:
-    features = []
+def _iter_edge_features(graph: LightGraph) -> Iterator[dict]:
+    """Feature LineString cho mỗi cặp node (2 chiều chỉ xuất 1 lần)"""
     seen = set()
     
     for from_node, neighbors in graph.adjacency.items():
@@ -658,7 +1176,7 @@ def graph_to_geojson(graph: LightGraph) -> dict:
                 continue
             seen.add(key)
             
-            features.append({
+            yield {
                 "type": "Feature",
                 "geometry": {"type": "LineString", "coordinates": edge.geometry or []},
                 "properties": {
@@ -666,39 +1184,54 @@ def graph_to_geojson(graph: LightGraph) -> dict:
                     "name": edge.name,
                     "length": edge.length
                 }
-            })
-    
-    return {"type": "FeatureCollection", "features": features}
+            }
 
 
-def copy_graph_with_modifications(
-    original: LightGraph,
-    blocked_edges: Set[Tuple[int, int]] = None,
-    weight_multipliers: Dict[Tuple[int, int], float] = None
-) -> LightGraph:
-    blocked_edges = blocked_edges or set()
-    weight_multipliers = weight_multipliers or {}
-    
-    new_graph = LightGraph()
-    new_graph.nodes = original.nodes.copy()
-    new_graph._node_ids = original._node_ids
-    new_graph._node_coords = original._node_coords
-    new_graph._kdtree = original._kdtree
-    
-    for from_node, neighbors in original.adjacency.items():
-        for to_node, edge in neighbors:
-            if (from_node, to_node) in blocked_edges:
-                continue
-            
-            if (from_node, to_node) in weight_multipliers:
-                new_edge = GraphEdge(
-                    edge.from_node, edge.to_node, edge.way_id, edge.length,
-                    edge.highway_type, edge.name, edge.speed,
-                    edge.c_highway * weight_multipliers[(from_node, to_node)],
-                    edge.geometry
-                )
-                new_graph.add_edge(new_edge)
-            else:
-                new_graph.add_edge(edge)
+def graph_to_geojson(graph: LightGraph) -> dict:
+    return {"type": "FeatureCollection", "features": list(_iter_edge_features(graph))}
+
+
+def iter_graph_features(graph: LightGraph) -> Iterator[bytes]:
+    """Như graph_to_geojson nhưng từng feature đã orjson-encode, không dựng list toàn graph"""
+    for feature in _iter_edge_features(graph):
+        yield orjson.dumps(feature)
+
+
+# ======================================================================
+# Persistence (pickle)
+# ======================================================================
+
+def save_graph(graph: LightGraph, path: Path):
+    """
+    Pickle graph đã build (kèm KD-Tree, STRtree) để lần khởi động sau không phải build lại
     
-    return new_graph
+    Ghi ra file tạm cùng thư mục rồi os.replace (atomic): nhiều worker ENV=prod khởi động lạnh
+    cùng lúc không ghi đè lẫn nhau, không worker nào đọc phải pickle ghi dở
+    """
+    tmp_path = None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        tmp_path = None
+    except Exception as e:
+        print(f"Lỗi ghi graph cache: {e}")
+    finally:
+        if tmp_path is not None:
+            Path(tmp_path).unlink(missing_ok=True)
+
+
+def load_graph(path: Path) -> Optional[LightGraph]:
+    """Load graph đã pickle, None nếu chưa có hoặc file lỗi"""
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'rb') as f:
+            graph = pickle.load(f)
+        print(f"Đã load graph từ cache: {graph.node_count} nodes, {graph.edge_count} edges")
+        return graph
+    except Exception as e:
+        print(f"Lỗi đọc graph cache: {e}")
+        return None
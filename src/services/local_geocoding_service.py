@@ -7,8 +7,11 @@ Local Geocoding Service sử dụng SQLite FTS5
 """
 import sqlite3
 import math
+import os
+import tempfile
+import unicodedata
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple, Set
+from typing import Collection, List, Dict, Optional, Tuple
 from dataclasses import dataclass
 
 # RapidFuzz cho fuzzy matching (optional, fallback nếu không có)
@@ -49,6 +52,21 @@ class SearchResult:
     address_type: str
 
 
+# ======================================================================
+# Text Normalization
+# ======================================================================
+
+def fold_address(text: str) -> str:
+    """
+    Chuẩn hóa địa chỉ để index/tìm kiếm: bỏ dấu, lowercase
+    
+    Ví dụ: "Phố Vĩnh Tuy" -> "pho vinh tuy", "Đường Láng" -> "duong lang"
+    (đ/Đ không tách được bằng NFKD nên map thủ công)
+    """
+    decomposed = unicodedata.normalize("NFKD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
 # ======================================================================
 # Address Extraction from OSM Data
 # ======================================================================
@@ -63,7 +81,7 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
 
-def extract_addresses_from_osm(osm_data: OSMData, graph_node_ids: Set[int]) -> List[AddressEntry]:
+def extract_addresses_from_osm(osm_data: OSMData, graph_node_ids: Collection[int]) -> List[AddressEntry]:
     """
     Trích xuất địa chỉ từ OSM data:
     1. Nodes có addr:housenumber
@@ -232,6 +250,7 @@ class LocalGeocodingDB:
                 lat REAL NOT NULL,
                 lon REAL NOT NULL,
                 address TEXT NOT NULL,
+                address_fold TEXT NOT NULL,
                 house_number TEXT,
                 street_name TEXT,
                 address_type TEXT,
@@ -240,9 +259,10 @@ class LocalGeocodingDB:
         """)
         
         # Tạo FTS5 virtual table với unicode61 tokenizer
+        # Index cột address_fold (đã bỏ dấu + lowercase lúc populate)
         self.conn.execute("""
             CREATE VIRTUAL TABLE IF NOT EXISTS address_search USING fts5(
-                address,
+                address_fold,
                 content='addresses',
                 content_rowid='id',
                 tokenize='unicode61 remove_diacritics 2'
@@ -264,10 +284,11 @@ class LocalGeocodingDB:
         
         # Insert addresses
         cursor.executemany("""
-            INSERT INTO addresses (node_id, lat, lon, address, house_number, street_name, address_type, rank_score)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO addresses (node_id, lat, lon, address, address_fold, house_number, street_name, address_type, rank_score)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, [
-            (a.node_id, a.lat, a.lon, a.address, a.house_number, a.street_name, a.address_type, a.rank_score)
+            (a.node_id, a.lat, a.lon, a.address, fold_address(a.address),
+             a.house_number, a.street_name, a.address_type, a.rank_score)
             for a in addresses
         ])
         
@@ -294,8 +315,9 @@ class LocalGeocodingDB:
         cursor = self.conn.cursor()
         
         # Prefix search với FTS5
+        # Query được fold giống lúc populate → khớp trực tiếp với address_fold
         # Escape special characters và thêm * cho prefix matching
-        safe_query = query.replace('"', '""').replace("'", "''")
+        safe_query = fold_address(query).replace('"', '""').replace("'", "''")
         
         try:
             # FTS5 MATCH với prefix
@@ -326,7 +348,7 @@ class LocalGeocodingDB:
                 cursor.execute("""
                     SELECT node_id, lat, lon, address, address_type, rank_score
                     FROM addresses
-                    WHERE address LIKE ?
+                    WHERE address_fold LIKE ?
                     ORDER BY rank_score DESC
                     LIMIT ?
                 """, (f'%{safe_query}%', limit))
@@ -375,7 +397,7 @@ class LocalGeocodingDB:
             cursor.execute("""
                 SELECT node_id, lat, lon, address, address_type, rank_score
                 FROM addresses
-                WHERE address LIKE ?
+                WHERE address_fold LIKE ?
                 ORDER BY rank_score DESC
                 LIMIT ?
             """, (f'%{safe_query}%', limit))
@@ -425,6 +447,49 @@ class LocalGeocodingDB:
         
         return {"total": total, "by_type": by_type}
     
+    def save(self, path: Path):
+        """
+        Ghi toàn bộ DB (bảng + index FTS5) ra file bằng SQLite backup API
+        Backup vào file tạm cùng thư mục rồi os.replace (atomic) như save_graph: worker khác
+        không đọc phải DB đang ghi dở
+        """
+        tmp_path = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+            os.close(fd)
+            disk = sqlite3.connect(tmp_path)
+            try:
+                self.conn.backup(disk)
+            finally:
+                disk.close()
+            os.replace(tmp_path, path)
+            tmp_path = None
+        except Exception as e:
+            print(f"Lỗi ghi geocoding cache: {e}")
+        finally:
+            if tmp_path is not None:
+                Path(tmp_path).unlink(missing_ok=True)
+    
+    @classmethod
+    def load(cls, path: Path) -> Optional["LocalGeocodingDB"]:
+        """Copy DB đã lưu vào in-memory DB mới, None nếu chưa có hoặc file lỗi"""
+        if not path.exists():
+            return None
+        db = cls(":memory:")
+        try:
+            disk = sqlite3.connect(str(path))
+            try:
+                disk.backup(db.conn)
+            finally:
+                disk.close()
+            db.get_stats()  # File hỏng/thiếu bảng → lỗi ngay tại đây
+            return db
+        except Exception as e:
+            print(f"Lỗi đọc geocoding cache: {e}")
+            db.close()
+            return None
+    
     def close(self):
         """Đóng connection"""
         if self.conn:
@@ -439,19 +504,33 @@ class LocalGeocodingDB:
 _geocoding_db: Optional[LocalGeocodingDB] = None
 
 
-def init_local_geocoding(osm_data: OSMData, graph_node_ids: Set[int]) -> LocalGeocodingDB:
+def init_local_geocoding(
+    osm_data: OSMData,
+    graph_node_ids: Collection[int],
+    cache_path: Optional[Path] = None
+) -> LocalGeocodingDB:
     """
     Khởi tạo local geocoding database từ OSM data
     
     Args:
         osm_data: Dữ liệu OSM đã parse
-        graph_node_ids: Set các node_id trong routing graph (LSCC)
+        graph_node_ids: Các node_id trong routing graph (LSCC) - chỉ đọc (duyệt + `in`),
+            nhận thẳng graph.nodes.keys() không cần copy ra set
+        cache_path: File SQLite lưu DB đã build (cạnh graph cache) - có thì load lại,
+            không phải extract + populate FTS5 mỗi lần khởi động
     
     Returns:
         LocalGeocodingDB instance
     """
     global _geocoding_db
     
+    if cache_path is not None:
+        cached = LocalGeocodingDB.load(cache_path)
+        if cached is not None:
+            _geocoding_db = cached
+            print(f"  ✓ Local geocoding load từ cache: {cached.get_stats()['total']} addresses")
+            return _geocoding_db
+    
     print("Building local geocoding database...")
     
     # Extract addresses
@@ -460,6 +539,8 @@ def init_local_geocoding(osm_data: OSMData, graph_node_ids: Set[int]) -> LocalGe
     # Create and populate DB
     _geocoding_db = LocalGeocodingDB(":memory:")  # In-memory for speed
     _geocoding_db.populate(addresses)
+    if cache_path is not None:
+        _geocoding_db.save(cache_path)
     
     stats = _geocoding_db.get_stats()
     print(f"  ✓ Local geocoding ready: {stats['total']} addresses")
@@ -4,7 +4,7 @@ Service để lấy dữ liệu bản đồ từ Overpass API
 Trả về dữ liệu JSON gồm nodes và ways
 """
 import requests
-import json
+import orjson
 import hashlib
 import os
 from pathlib import Path
@@ -22,6 +22,10 @@ OVERPASS_ENDPOINTS = [
     "https://maps.mail.ru/osm/tools/overpass/api/interpreter",
 ]
 
+# Session dùng chung: giữ kết nối keep-alive tới các endpoint thay vì handshake TCP/TLS mỗi lần POST
+SESSION = requests.Session()
+SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=len(OVERPASS_ENDPOINTS), pool_maxsize=4))
+
 
 @dataclass
 class OSMNode:
@@ -93,9 +97,7 @@ def _load_from_cache(cache_key: str) -> Optional[OSMData]:
     cache_file = CACHE_DIR / f"{cache_key}.json"
     if cache_file.exists():
         try:
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return OSMData.from_dict(data)
+            return OSMData.from_dict(orjson.loads(cache_file.read_bytes()))
         except Exception as e:
             print(f"Lỗi đọc cache: {e}")
     return None
@@ -105,8 +107,7 @@ def _save_to_cache(cache_key: str, osm_data: OSMData):
     """Lưu dữ liệu vào cache"""
     cache_file = CACHE_DIR / f"{cache_key}.json"
     try:
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(osm_data.to_dict(), f, ensure_ascii=False)
+        cache_file.write_bytes(orjson.dumps(osm_data.to_dict()))
     except Exception as e:
         print(f"Lỗi ghi cache: {e}")
 
@@ -201,7 +202,7 @@ def fetch_from_overpass(bbox: tuple, use_cache: bool = True) -> Optional[OSMData
     for endpoint in OVERPASS_ENDPOINTS:
         try:
             print(f"Đang thử endpoint: {endpoint}")
-            response = requests.post(
+            response = SESSION.post(
                 endpoint,
                 data={"data": query},
                 timeout=120,
@@ -217,10 +218,10 @@ def fetch_from_overpass(bbox: tuple, use_cache: bool = True) -> Optional[OSMData
         print("Không thể kết nối Overpass API")
         return None
     
-    # Parse response
+    # Parse response (orjson trên bytes thô: payload Overpass vài MB, nhanh hơn json stdlib nhiều lần)
     try:
-        raw_data = response.json()
-    except json.JSONDecodeError as e:
+        raw_data = orjson.loads(response.content)
+    except orjson.JSONDecodeError as e:
         print(f"Lỗi parse JSON: {e}")
         return None
     
@@ -310,7 +311,7 @@ out skel qt;
     for endpoint in OVERPASS_ENDPOINTS:
         try:
             print(f"Đang thử endpoint: {endpoint}")
-            response = requests.post(
+            response = SESSION.post(
                 endpoint,
                 data={"data": query},
                 timeout=180,
@@ -327,8 +328,8 @@ out skel qt;
         return None
     
     try:
-        raw_data = response.json()
-    except json.JSONDecodeError as e:
+        raw_data = orjson.loads(response.content)
+    except orjson.JSONDecodeError as e:
         print(f"Lỗi parse JSON: {e}")
         return None
     
@@ -0,0 +1,94 @@
+# tests/test_contraction_hierarchy.py
+"""
+ContractionHierarchy.query so với scipy Dijkstra trên graph đồ chơi
+- Lưới có đường 1 chiều (có cặp node không tới được) và edge song song khác weight
+- Weight ngẫu nhiên (float) → đường ngắn nhất duy nhất, so được cả chuỗi node
+"""
+import math
+import random
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from src.services.contraction_hierarchy import ContractionHierarchy
+
+GRID = 6
+
+
+def _toy_graph(seed: int = 7):
+    """CSR (indptr, indices, weights theo edge_idx) của lưới GRID x GRID"""
+    rng = random.Random(seed)
+    n = GRID * GRID
+    edges = []  # (u, v, w)
+    for r in range(GRID):
+        for c in range(GRID):
+            u = r * GRID + c
+            for v in ([u + 1] if c + 1 < GRID else []) + ([u + GRID] if r + 1 < GRID else []):
+                kind = rng.random()
+                if kind < 0.25:
+                    edges.append((u, v, rng.uniform(1, 10)))      # 1 chiều u → v
+                elif kind < 0.4:
+                    edges.append((v, u, rng.uniform(1, 10)))      # 1 chiều v → u
+                else:
+                    edges.append((u, v, rng.uniform(1, 10)))
+                    edges.append((v, u, rng.uniform(1, 10)))
+                if rng.random() < 0.2:
+                    edges.append((u, v, rng.uniform(1, 10)))      # edge song song
+    edges.sort(key=lambda e: e[0])
+    indptr = np.zeros(n + 1, dtype=np.int32)
+    for u, _, _ in edges:
+        indptr[u + 1] += 1
+    indptr = np.cumsum(indptr).astype(np.int32)
+    indices = np.array([v for _, v, _ in edges], dtype=np.int32)
+    weights = [w for _, _, w in edges]
+    return n, indptr, indices, weights
+
+
+def _edge_source(indptr: np.ndarray, edge_idx: int) -> int:
+    return int(np.searchsorted(indptr, edge_idx, side="right")) - 1
+
+
+def test_query_matches_dijkstra():
+    n, indptr, indices, weights = _toy_graph()
+    ch = ContractionHierarchy.build(indptr, indices, weights)
+    
+    # Edge song song: scipy cộng dồn entry trùng → giữ weight nhỏ nhất trước khi dựng ma trận
+    best = {}
+    for k, w in enumerate(weights):
+        key = (_edge_source(indptr, k), int(indices[k]))
+        best[key] = min(best.get(key, math.inf), w)
+    rows, cols = zip(*best)
+    matrix = csr_matrix((list(best.values()), (rows, cols)), shape=(n, n))
+    dist, pred = dijkstra(matrix, directed=True, return_predecessors=True)
+    
+    unreachable = 0
+    for s in range(n):
+        for t in range(n):
+            cost, edge_ids, _ = ch.query(s, t)
+            if math.isinf(dist[s, t]):
+                unreachable += 1
+                assert edge_ids is None and math.isinf(cost)
+                continue
+            assert math.isclose(cost, dist[s, t], rel_tol=1e-9)
+            
+            # Chuỗi edge gốc nối liền s → t, mỗi edge là edge rẻ nhất trong các edge song song
+            node = s
+            total = 0.0
+            nodes = [s]
+            for k in edge_ids:
+                assert _edge_source(indptr, k) == node
+                node = int(indices[k])
+                assert weights[k] == best[(nodes[-1], node)]
+                total += weights[k]
+                nodes.append(node)
+            assert node == t
+            assert math.isclose(total, dist[s, t], rel_tol=1e-9)
+            
+            expected = [t]
+            while expected[-1] != s:
+                expected.append(int(pred[s, expected[-1]]))
+            assert nodes == expected[::-1]
+    
+    # Graph đồ chơi phải thật sự có cặp không tới được (đường 1 chiều)
+    assert unreachable > 0
@@ -0,0 +1,111 @@
+# tests/test_numba_kernels.py
+"""
+Kernel numba (chỉ chạy khi import được numba) so với bản thuần Python tương ứng
+- compress_graph: _compress_graph_csr (_degree2_mask/_walk_chains) vs _compress_graph_dict
+- A*: _astar_core vs _astar_loop (cùng thứ tự pop → cùng nodes_visited và đường đi)
+"""
+import random
+
+import numpy as np
+import pytest
+
+pytest.importorskip("numba")
+
+from src.services import graph_builder as gb
+from src.services import fast_pathfinding_service as fps
+from src.services.graph_builder import GraphEdge, GraphNode, LightGraph, haversine_distance
+
+GRID = 6
+HIGHWAYS = ["primary", "secondary", "residential", "service"]
+
+
+def _toy_raw_graph(seed: int = 3) -> LightGraph:
+    """
+    Lưới GRID x GRID, mỗi cạnh lưới chia thêm 0-2 node trung gian (chuỗi node bậc 2);
+    mỗi hàng/cột là 1 way với highway_type riêng, một số way 1 chiều, thêm 1 ốc đảo ngoài LSCC
+    """
+    rng = random.Random(seed)
+    graph = LightGraph()
+    next_id = [1]
+    
+    def node(lat, lon):
+        n = GraphNode(next_id[0], lat, lon)
+        next_id[0] += 1
+        graph.add_node(n)
+        return n
+    
+    def link(a, b, way_id, highway, oneway):
+        length = haversine_distance(a.lat, a.lon, b.lat, b.lon)
+        geometry = [(a.lon, a.lat), (b.lon, b.lat)]
+        graph.add_edge(GraphEdge(a.id, b.id, way_id, length, highway, "", 30.0, gb.C_HIGHWAY[highway], geometry))
+        if not oneway:
+            graph.add_edge(GraphEdge(b.id, a.id, way_id, length, highway, "", 30.0, gb.C_HIGHWAY[highway], geometry[::-1]))
+    
+    corners = [[node(21.0 + r * 1e-3, 105.85 + c * 1e-3) for c in range(GRID)] for r in range(GRID)]
+    ways = [[corners[r][c] for c in range(GRID)] for r in range(GRID)]
+    ways += [[corners[r][c] for r in range(GRID)] for c in range(GRID)]
+    for way_id, way in enumerate(ways):
+        highway = rng.choice(HIGHWAYS)
+        oneway = rng.random() < 0.3
+        for a, b in zip(way, way[1:]):
+            # Node trung gian: chuỗi bậc 2 cùng highway_type (đôi khi đổi type giữa chừng → không gộp)
+            chain = [a]
+            for i in range(rng.randrange(3)):
+                t = (i + 1) / 4
+                chain.append(node(a.lat + (b.lat - a.lat) * t, a.lon + (b.lon - a.lon) * t))
+            chain.append(b)
+            mixed = rng.random() < 0.15
+            for i, (u, v) in enumerate(zip(chain, chain[1:])):
+                link(u, v, way_id, HIGHWAYS[0] if mixed and i == 0 else highway, oneway)
+    
+    # Ốc đảo: nối 1 chiều vào lưới → không thuộc LSCC
+    island = node(21.1, 105.9)
+    link(island, corners[0][0], len(ways), "service", True)
+    return graph
+
+
+def _signature(graph: LightGraph):
+    return [
+        (u, [(v, e.way_id, e.length, e.highway_type, e.geometry) for v, e in graph.adjacency[u]])
+        for u in graph.nodes
+    ]
+
+
+@pytest.mark.parametrize("use_lscc", [True, False])
+def test_compress_csr_matches_dict(use_lscc):
+    raw = _toy_raw_graph()
+    lscc = gb.find_largest_scc(raw) if use_lscc else None
+    assert not use_lscc or len(lscc) < raw.node_count
+    
+    by_dict, nodes_d, edges_d = gb._compress_graph_dict(raw, lscc)
+    by_csr, nodes_c, edges_c = gb._compress_graph_csr(raw, lscc)
+    
+    assert (nodes_d, edges_d) == (nodes_c, edges_c)
+    assert by_csr.node_count < nodes_c  # thật sự có chuỗi bậc 2 được gộp
+    assert _signature(by_dict) == _signature(by_csr)
+
+
+def test_astar_core_matches_loop():
+    raw = _toy_raw_graph()
+    graph = gb.compress_graph(raw, gb.find_largest_scc(raw))
+    graph.build_node_index()
+    weights_arr = graph.weights_array_for("normal")
+    weights = graph.weights_for("normal")
+    n = len(graph.node_index)
+    ctx = fps.AstarContext()
+    
+    for start_idx in range(n):
+        for end_idx in range(n):
+            h = fps._heuristic_array(graph, end_idx, "normal", use_alt=False)
+            found_k, visited_k, came_from_k, came_edge_k = fps._astar_core(
+                graph.csr_indptr, graph.csr_indices, weights_arr, h, start_idx, end_idx
+            )
+            ctx.reset(n)
+            found_l, visited_l = fps._astar_loop(graph, ctx, start_idx, end_idx, weights, h.tolist())
+            
+            assert (found_k, visited_k) == (found_l, visited_l)
+            assert found_k  # LSCC: mọi cặp đều tới được
+            path_k, edges_k = fps._trace_path_kernel(came_from_k, came_edge_k, start_idx, end_idx)
+            path_l, edges_l = fps._trace_path(ctx.came_from, ctx.came_from_edge, start_idx, end_idx)
+            assert path_k.tolist() == path_l.tolist()
+            assert edges_k.tolist() == edges_l.tolist()